@@ -0,0 +1,130 @@
+"""
+Caregiver availability from appointment.time_range
+(migrations/0004_appointment_time_range.sql).
+
+A caregiver is busy while they have a confirmed appointment; everything
+else in the asked-for window is free. Every query here is a single overlap
+test against the (caregiver_user_id, time_range) GiST index, however many
+caregivers or days are involved. Each also bounds appointment_date, so
+only the monthly partitions that can hold an overlapping appointment are
+read (migrations/0008_partition_appointment.sql).
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from pagination import fetch_page
+
+# longest window one request may ask about
+MAX_WINDOW = timedelta(days=31)
+# most caregivers one free/busy request may ask about
+MAX_CAREGIVERS = 1000
+# work_hours is under 100, so an appointment overlapping the window started
+# at most this many days before it
+LOOKBACK_DAYS = 5
+
+
+def date_bounds(column='appointment_date'):
+    """Condition on column covering every appointment that could overlap [:start, :end)"""
+    return f"{column} >= CAST(:start AS DATE) - {LOOKBACK_DAYS} AND {column} <= CAST(:end AS DATE)"
+
+
+def parse_window(args):
+    """(start, end) datetimes from ?start=&end= (ISO format); ValueError on junk"""
+    start = args.get('start', '').strip()
+    end = args.get('end', '').strip()
+    if not start or not end:
+        raise ValueError("start and end are required (YYYY-MM-DDTHH:MM)")
+    start, end = datetime.fromisoformat(start), datetime.fromisoformat(end)
+    if end <= start:
+        raise ValueError("end must be after start")
+    if end - start > MAX_WINDOW:
+        raise ValueError(f"window can be at most {MAX_WINDOW.days} days")
+    return start, end
+
+
+def parse_ids(value):
+    """Caregiver ids from a comma separated string; ValueError on junk"""
+    ids = sorted({int(part) for part in value.split(',') if part.strip()})
+    if len(ids) > MAX_CAREGIVERS:
+        raise ValueError(f"at most {MAX_CAREGIVERS} caregivers per request")
+    return ids
+
+
+def busy_ids(session, caregiver_ids, start, end):
+    """Those of caregiver_ids with a confirmed appointment overlapping [start, end)"""
+    rows = session.execute(text(f"""
+        SELECT DISTINCT caregiver_user_id
+        FROM appointment
+        WHERE caregiver_user_id = ANY(:ids)
+          AND status = 'confirmed'
+          AND time_range && tsrange(:start, :end)
+          AND {date_bounds()}
+    """), {'ids': list(caregiver_ids), 'start': start, 'end': end})
+    return {row[0] for row in rows}
+
+
+def busy_slots(session, caregiver_ids, start, end):
+    """{caregiver id: [(from, to), ...]} of confirmed time clipped to the window"""
+    slots = {caregiver_id: [] for caregiver_id in caregiver_ids}
+    rows = session.execute(text(f"""
+        SELECT caregiver_user_id,
+               greatest(lower(time_range), :start) AS busy_from,
+               least(upper(time_range), :end) AS busy_to
+        FROM appointment
+        WHERE caregiver_user_id = ANY(:ids)
+          AND status = 'confirmed'
+          AND time_range && tsrange(:start, :end)
+          AND {date_bounds()}
+        ORDER BY caregiver_user_id, lower(time_range)
+    """), {'ids': list(caregiver_ids), 'start': start, 'end': end})
+    for caregiver_id, busy_from, busy_to in rows:
+        slots[caregiver_id].append((busy_from, busy_to))
+    return slots
+
+
+def free_slots(busy, start, end):
+    """The gaps between sorted busy slots within [start, end)"""
+    free = []
+    cursor = start
+    for busy_from, busy_to in busy:
+        if busy_from > cursor:
+            free.append((cursor, busy_from))
+        cursor = max(cursor, busy_to)
+    if cursor < end:
+        free.append((cursor, end))
+    return free
+
+
+def free_busy(session, caregiver_ids, start, end):
+    """{caregiver id: {'busy': [...], 'free': [...]}} for many caregivers in one query"""
+    return {
+        caregiver_id: {'busy': busy, 'free': free_slots(busy, start, end)}
+        for caregiver_id, busy in busy_slots(session, caregiver_ids, start, end).items()
+    }
+
+
+def free_caregivers(session, start, end, args, caregiving_type=None, city=None):
+    """Page of caregivers with nothing confirmed in [start, end), by id"""
+    conditions = [f"""NOT EXISTS (
+        SELECT 1 FROM appointment a
+        WHERE a.caregiver_user_id = c.caregiver_user_id
+          AND a.status = 'confirmed'
+          AND a.time_range && tsrange(:start, :end)
+          AND {date_bounds('a.appointment_date')}
+    )"""]
+    conditions.append("u.deleted_at IS NULL")
+    params = {'start': start, 'end': end}
+    if caregiving_type:
+        conditions.append("c.caregiving_type = :caregiving_type")
+        params['caregiving_type'] = caregiving_type
+    if city:
+        conditions.append("u.city = :city")
+        params['city'] = city
+    return fetch_page(session, """
+        SELECT c.caregiver_user_id, u.given_name, u.surname, u.city, c.caregiving_type, c.hourly_rate
+        FROM caregiver c
+        JOIN "user" u ON u.user_id = c.caregiver_user_id
+    """, [('c.caregiver_user_id', 'caregiver_user_id')], args, params=params,
+        where=' AND '.join(conditions))
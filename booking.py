@@ -0,0 +1,120 @@
+"""
+Appointment booking that can't double-book a caregiver.
+
+Everything happens in one call to book_appointment()
+(migrations/0005_book_appointment_function.sql): take the caregiver's
+advisory lock, check for an overlapping pending/confirmed appointment,
+insert. That's one round trip per booking, and concurrent bookings for the
+same caregiver wait at most BOOKING_LOCK_WAIT_MS before being told to try
+again, instead of piling up behind each other.
+
+Edits go through reschedule_appointment()
+(migrations/0013_reschedule_appointment_function.sql) the same way. It
+takes the same lock and does the same check, leaving out the appointment
+being edited.
+"""
+
+import os
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+BOOKING_LOCK_WAIT_MS = int(os.getenv('BOOKING_LOCK_WAIT_MS', '50'))
+
+BOOKED = 'booked'
+UPDATED = 'updated'
+CONFLICT = 'conflict'
+BUSY = 'busy'
+MISSING = 'missing'
+
+# SQLSTATE of the appointment_confirmed_no_overlap exclusion constraint
+EXCLUSION_VIOLATION = '23P01'
+
+
+class BookingResult:
+    def __init__(self, outcome, appointment_id=None, conflict_id=None):
+        self.outcome = outcome
+        self.appointment_id = appointment_id
+        self.conflict_id = conflict_id
+
+    @property
+    def booked(self):
+        return self.outcome == BOOKED
+
+    @property
+    def updated(self):
+        return self.outcome == UPDATED
+
+    def message(self):
+        if self.outcome == BOOKED:
+            return 'Appointment created successfully!'
+        if self.outcome == UPDATED:
+            return 'Appointment updated successfully!'
+        if self.outcome == MISSING:
+            return 'Appointment not found!'
+        if self.outcome == CONFLICT:
+            if self.conflict_id:
+                return f'Caregiver already has appointment #{self.conflict_id} at that time'
+            return 'Caregiver already has an appointment at that time'
+        return 'Caregiver is being booked by someone else right now, please try again'
+
+
+def _run(session, sql, params):
+    """Run a booking function and commit; its row, or None when a constraint found an overlap"""
+    try:
+        row = session.execute(text(sql), params).one()
+        # commit releases the caregiver's lock either way
+        session.commit()
+    except IntegrityError as e:
+        session.rollback()
+        if getattr(e.orig, 'pgcode', None) == EXCLUSION_VIOLATION:
+            return None
+        raise
+    except Exception:
+        session.rollback()
+        raise
+    return row
+
+
+def book(session, caregiver_user_id, member_user_id, appointment_date, appointment_time, work_hours,
+         status='pending', lock_wait_ms=BOOKING_LOCK_WAIT_MS):
+    """Book and commit. Returns a BookingResult; other database errors propagate after a rollback."""
+    row = _run(session, """
+        SELECT outcome, booked_id, conflict_id
+        FROM book_appointment(:caregiver_user_id, :member_user_id, :appointment_date, :appointment_time,
+                              :work_hours, :status, :lock_wait_ms)
+    """, {
+        'caregiver_user_id': caregiver_user_id,
+        'member_user_id': member_user_id,
+        'appointment_date': appointment_date,
+        'appointment_time': appointment_time,
+        'work_hours': work_hours,
+        'status': status,
+        'lock_wait_ms': lock_wait_ms,
+    })
+    if row is None:
+        return BookingResult(CONFLICT)
+    return BookingResult(row.outcome, row.booked_id, row.conflict_id)
+
+
+def reschedule(session, appointment_id, current_date, caregiver_user_id, member_user_id, appointment_date,
+               appointment_time, work_hours, status, lock_wait_ms=BOOKING_LOCK_WAIT_MS):
+    """Update appointment (appointment_id, current_date) and commit, with the same checks as book()"""
+    row = _run(session, """
+        SELECT outcome, conflict_id
+        FROM reschedule_appointment(:appointment_id, :current_date, :caregiver_user_id, :member_user_id,
+                                    :appointment_date, :appointment_time, :work_hours, :status, :lock_wait_ms)
+    """, {
+        'appointment_id': appointment_id,
+        'current_date': current_date,
+        'caregiver_user_id': caregiver_user_id,
+        'member_user_id': member_user_id,
+        'appointment_date': appointment_date,
+        'appointment_time': appointment_time,
+        'work_hours': work_hours,
+        'status': status,
+        'lock_wait_ms': lock_wait_ms,
+    })
+    if row is None:
+        return BookingResult(CONFLICT)
+    return BookingResult(row.outcome, appointment_id, row.conflict_id)
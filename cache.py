@@ -0,0 +1,103 @@
+"""
+Small in-process cache with per-namespace versions.
+
+Entries are grouped into namespaces (e.g. 'caregivers', 'jobs'). Invalidating
+a namespace just bumps its version number; entries stored under an older
+version are treated as misses and get evicted lazily. A loader that started
+before an invalidation stores its result under the version it started with,
+so it can never put stale data back in after a write. An entry can depend on
+several namespaces at once (pass a tuple as the namespace); it's stale as soon
+as any of them is invalidated.
+
+The cache is bounded by total weight (by default the number of items in the
+cached values) and evicts least recently used entries first.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class VersionedCache:
+    def __init__(self, max_weight=1_000_000, ttl=None, weigh=None):
+        self.max_weight = max_weight
+        self.ttl = ttl
+        self.weigh = weigh or _default_weight
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._weight = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, namespace):
+        with self._lock:
+            return self._current(namespace)
+
+    def _current(self, namespace):
+        if isinstance(namespace, tuple):
+            return tuple(self._versions.get(n, 0) for n in namespace)
+        return self._versions.get(namespace, 0)
+
+    def get(self, namespace, key=None):
+        """Cached value or None"""
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            version, stored_at, value, _ = entry
+            expired = self.ttl is not None and time.monotonic() - stored_at > self.ttl
+            if version != self._current(namespace) or expired:
+                self._remove((namespace, key))
+                self.misses += 1
+                return None
+            self._entries.move_to_end((namespace, key))
+            self.hits += 1
+            return value
+
+    def set(self, namespace, key, value, version):
+        """Store value if version is still current for the namespace"""
+        weight = self.weigh(value)
+        if weight > self.max_weight:
+            return
+        with self._lock:
+            if version != self._current(namespace):
+                return
+            if (namespace, key) in self._entries:
+                self._remove((namespace, key))
+            self._entries[(namespace, key)] = (version, time.monotonic(), value, weight)
+            self._weight += weight
+            while self._weight > self.max_weight:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def get_or_load(self, namespace, key, loader):
+        value = self.get(namespace, key)
+        if value is None:
+            version = self.version(namespace)
+            value = loader()
+            self.set(namespace, key, value, version)
+        return value
+
+    def invalidate(self, *namespaces):
+        with self._lock:
+            for namespace in namespaces:
+                self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+
+    def _remove(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._weight -= entry[3]
+
+
+def _default_weight(value):
+    try:
+        return max(1, len(value))
+    except TypeError:
+        return 1
@@ -0,0 +1,142 @@
+"""
+Cross-process cache invalidation over Postgres LISTEN/NOTIFY.
+
+Every web worker runs one ChangeListener thread holding its own database
+connection (outside the pool) that LISTENs on table_changes, the channel
+the triggers from migrations/0006_change_notifications.sql notify on. Events
+that arrive within CHANGE_COALESCE_MS of each other are merged, so a burst of
+writes turns into one call to the handler:
+
+    handler({'caregiver': {12, 15}, 'appointment': None})
+
+where None means "anything in the table may have changed". After a lost
+connection the listener reconnects with backoff and reports every table as
+changed, since events sent in between are gone.
+
+LISTEN needs a real session, so behind a transaction-level pooler point
+CHANGE_LISTENER_URL at Postgres directly.
+"""
+
+import json
+import logging
+import os
+import select
+import threading
+import time
+
+from sqlalchemy import create_engine
+
+CHANNEL = 'table_changes'
+TABLES = ('user', 'caregiver', 'member', 'address', 'job', 'job_application', 'appointment')
+
+CHANGE_COALESCE_MS = float(os.getenv('CHANGE_COALESCE_MS', '5'))
+CHANGE_LISTENER_URL = os.getenv('CHANGE_LISTENER_URL')
+# most ids kept per table per batch before it's treated as a whole-table change
+MAX_IDS_PER_TABLE = 1000
+RECONNECT_DELAYS = (0.5, 1, 2, 5, 10, 30)
+
+listener_log = logging.getLogger('caregivers.changes')
+
+
+def merge_event(changes, payload):
+    """Fold one notification payload into a {table: ids or None} dict"""
+    try:
+        event = json.loads(payload)
+        table = event['t']
+    except (ValueError, KeyError, TypeError):
+        listener_log.warning(json.dumps({'event': 'bad_notification', 'payload': payload[:200]}))
+        return
+    ids = event.get('ids')
+    if ids is None:
+        changes[table] = None
+        return
+    if table in changes and changes[table] is None:
+        return
+    known = changes.setdefault(table, set())
+    known.update(tuple(i) if isinstance(i, list) else i for i in ids)
+    if len(known) > MAX_IDS_PER_TABLE:
+        changes[table] = None
+
+
+class ChangeListener(threading.Thread):
+    def __init__(self, engine_or_url, handler, coalesce_ms=CHANGE_COALESCE_MS):
+        super().__init__(name='change-listener', daemon=True)
+        engine = create_engine(engine_or_url) if isinstance(engine_or_url, str) else engine_or_url
+        self._dialect = engine.dialect
+        self._connect_args = engine.dialect.create_connect_args(engine.url)
+        self.handler = handler
+        self.coalesce = coalesce_ms / 1000
+        self._stopping = threading.Event()
+        self._conn = None
+        self.batches = 0
+
+    def stop(self):
+        self._stopping.set()
+
+    def _connect(self):
+        cargs, cparams = self._connect_args
+        # a plain DBAPI connection, never handed out by the pool
+        conn = self._dialect.connect(*cargs, **cparams)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        return conn
+
+    def run(self):
+        attempt = 0
+        first = True
+        while not self._stopping.is_set():
+            try:
+                self._conn = self._connect()
+                if not first:
+                    # events sent while we were away are lost
+                    self._dispatch({table: None for table in TABLES})
+                first = False
+                attempt = 0
+                self._listen()
+            except Exception as e:
+                delay = RECONNECT_DELAYS[min(attempt, len(RECONNECT_DELAYS) - 1)]
+                attempt += 1
+                first = False
+                listener_log.warning(json.dumps({'event': 'listener_disconnected', 'error': str(e),
+                                                 'retry_in_s': delay}))
+                self._stopping.wait(delay)
+            finally:
+                if self._conn is not None:
+                    try:
+                        self._conn.close()
+                    except Exception:
+                        pass
+                    self._conn = None
+
+    def _listen(self):
+        conn = self._conn
+        while not self._stopping.is_set():
+            # wake up once a second to notice stop()
+            if not select.select([conn], [], [], 1.0)[0]:
+                continue
+            changes = {}
+            deadline = time.monotonic() + self.coalesce
+            while True:
+                conn.poll()
+                while conn.notifies:
+                    merge_event(changes, conn.notifies.pop(0).payload)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([conn], [], [], remaining)[0]:
+                    break
+            if changes:
+                self._dispatch(changes)
+
+    def _dispatch(self, changes):
+        self.batches += 1
+        try:
+            self.handler(changes)
+        except Exception:
+            listener_log.exception('change handler failed')
+
+
+def start(engine, handler):
+    """Start a listener thread for this process, on CHANGE_LISTENER_URL if set"""
+    listener = ChangeListener(CHANGE_LISTENER_URL or engine, handler)
+    listener.start()
+    return listener
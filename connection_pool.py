@@ -0,0 +1,186 @@
+"""
+Connection pool settings and live pool statistics.
+
+Every setting comes from the environment so pools can be sized per
+deployment without a code change:
+
+    DB_POOL_SIZE            connections kept open per process (default 5, 0 = no pooling)
+    DB_MAX_OVERFLOW         extra connections allowed under load (default 10)
+    DB_POOL_TIMEOUT         seconds to wait for a free connection (default 30)
+    DB_POOL_RECYCLE         reconnect connections older than this many seconds (default 1800, -1 = never)
+    DB_POOL_PRE_PING        test connections on checkout (default on)
+    DB_STATEMENT_TIMEOUT_MS cancel statements running longer than this (default 0 = off)
+    DB_POOL_MODE            'session' (default) or 'transaction' when connecting through a
+                            transaction-level pooler such as PgBouncer
+    DB_POOL_WAIT_WARNING_MS log checkouts that waited longer than this (default 100)
+
+In transaction mode nothing relies on per-connection session state: the
+statement timeout is set with SET LOCAL at the start of every transaction
+instead of as a connection startup option. Migrations and anything else that
+needs session-level locks or LISTEN should connect to Postgres directly.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+from instrumentation import Histogram, LATENCY_BUCKETS
+
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1').lower() not in ('0', 'false', 'no', 'off')
+STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '0'))
+POOL_MODE = os.getenv('DB_POOL_MODE', 'session')
+POOL_WAIT_WARNING_MS = float(os.getenv('DB_POOL_WAIT_WARNING_MS', '100'))
+
+POOL_MODES = ('session', 'transaction')
+
+pool_log = logging.getLogger('caregivers.pool')
+
+
+class PoolStats:
+    """Counters fed by the pool events, shared by every thread in the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait = Histogram(LATENCY_BUCKETS)
+        self.max_wait = 0.0
+
+    def observe_wait(self, seconds):
+        with self._lock:
+            self.wait.observe(seconds)
+            self.max_wait = max(self.max_wait, seconds)
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self, pool):
+        """Current pool state plus the totals since the process started"""
+        with self._lock:
+            stats = {
+                'pool_class': type(pool).__name__,
+                'mode': POOL_MODE,
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'invalidations': self.invalidations,
+                'timeouts': self.timeouts,
+                'wait_count': self.wait.total,
+                'wait_seconds_total': round(self.wait.sum, 6),
+                'wait_seconds_max': round(self.max_wait, 6),
+            }
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                         overflow=max(pool.overflow(), 0), max_overflow=pool._max_overflow)
+        return stats
+
+    def render(self, pool):
+        """Prometheus text format, appended to /metrics"""
+        snapshot = self.snapshot(pool)
+        lines = []
+        for key in ('size', 'checked_in', 'checked_out', 'overflow'):
+            if key in snapshot:
+                lines.append(f'# TYPE caregivers_db_pool_{key} gauge')
+                lines.append(f'caregivers_db_pool_{key} {snapshot[key]}')
+        for key in ('connects', 'checkouts', 'invalidations', 'timeouts'):
+            lines.append(f'# TYPE caregivers_db_pool_{key}_total counter')
+            lines.append(f'caregivers_db_pool_{key}_total {snapshot[key]}')
+        with self._lock:
+            name = 'caregivers_db_pool_wait_seconds'
+            lines.append(f'# HELP {name} time to get a connection from the pool')
+            lines.append(f'# TYPE {name} histogram')
+            for bound, count in zip(self.wait.buckets, self.wait.counts):
+                lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {self.wait.total}')
+            lines.append(f'{name}_sum {self.wait.sum:.6f}')
+            lines.append(f'{name}_count {self.wait.total}')
+        return '\n'.join(lines) + '\n'
+
+
+stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited (including connecting)"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            stats.count('timeouts')
+            pool_log.error(json.dumps({
+                'event': 'pool_timeout',
+                'timeout_s': self._timeout,
+                'size': self.size(),
+                'overflow': self.overflow(),
+            }))
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            stats.observe_wait(waited)
+            if waited * 1000 >= POOL_WAIT_WARNING_MS:
+                pool_log.warning(json.dumps({
+                    'event': 'slow_checkout',
+                    'wait_ms': round(waited * 1000, 2),
+                    'checked_out': self.checkedout(),
+                    'overflow': max(self.overflow(), 0),
+                }))
+
+
+def engine_options():
+    """Keyword arguments for create_engine() from the DB_* settings"""
+    if POOL_MODE not in POOL_MODES:
+        raise ValueError(f"DB_POOL_MODE must be one of {', '.join(POOL_MODES)}")
+    options = {'pool_pre_ping': POOL_PRE_PING}
+    if POOL_SIZE <= 0:
+        options['poolclass'] = NullPool
+    else:
+        options.update(poolclass=TimedQueuePool, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW,
+                       pool_timeout=POOL_TIMEOUT, pool_recycle=POOL_RECYCLE)
+    if STATEMENT_TIMEOUT_MS and POOL_MODE == 'session':
+        options['connect_args'] = {'options': f'-c statement_timeout={STATEMENT_TIMEOUT_MS}'}
+    return options
+
+
+def _on_connect(dbapi_connection, connection_record):
+    stats.count('connects')
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    stats.count('checkouts')
+
+
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    stats.count('invalidations')
+    pool_log.warning(json.dumps({'event': 'connection_invalidated', 'error': str(exception) if exception else None}))
+
+
+def _set_local_statement_timeout(conn):
+    # straight on the DBAPI cursor so it isn't counted as an app query
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"SET LOCAL statement_timeout = {STATEMENT_TIMEOUT_MS}")
+    finally:
+        cursor.close()
+
+
+def attach(engine):
+    """Hook the pool events up to the shared stats"""
+    event.listen(engine, 'connect', _on_connect)
+    event.listen(engine, 'checkout', _on_checkout)
+    event.listen(engine, 'invalidate', _on_invalidate)
+    if STATEMENT_TIMEOUT_MS and POOL_MODE == 'transaction':
+        event.listen(engine, 'begin', _set_local_statement_timeout)
@@ -0,0 +1,72 @@
+"""
+Gunicorn settings for running the web application in production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is imported once in the master (preload_app) and the workers are
+forked from it, one per core by default. The engine never connects in the
+master, and each worker starts with a fresh connection pool (post_fork), so
+no psycopg2 connection is ever shared between processes. Workers compile
+templates before the fork and open their pool connections before they
+accept requests. They are recycled after max_requests (+ jitter, so they
+don't all restart together), finishing in-flight requests first. Each
+worker also runs a change listener thread (change_listener.py) that drops
+its cached pages and caregiver index entries when another worker writes,
+and TASK_WORKERS threads that run queued background tasks (tasks.py).
+The master makes sure the coming months' appointment partitions exist.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_WORKERS', str(multiprocessing.cpu_count())))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '4'))
+preload_app = True
+
+max_requests = int(os.getenv('MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.getenv('MAX_REQUESTS_JITTER', '1000'))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '30'))
+timeout = int(os.getenv('WORKER_TIMEOUT', '60'))
+keepalive = 5
+
+
+def when_ready(server):
+    # runs in the master after the app is loaded and before any worker is
+    # forked, so compiled templates are shared copy-on-write
+    import app
+    app.warm_up(connections=0)
+    # next months' appointment partitions (partitions.py), on a connection
+    # of its own since the master keeps no pool
+    import partitions
+    try:
+        created = partitions.ensure_on_startup(app.DATABASE_URL)
+        if created:
+            server.log.info("Created appointment partitions: %s", ', '.join(created))
+    except Exception as e:
+        server.log.warning("Could not create appointment partitions: %s", e)
+
+
+def post_fork(server, worker):
+    import app
+    # drop any pool state inherited from the master without closing the
+    # parent's sockets
+    app.engine.dispose(close=False)
+    # nothing to warm without an app-side pool (DB_POOL_SIZE=0)
+    pool_size = app.engine.pool.size() if hasattr(app.engine.pool, 'size') else 0
+    try:
+        app.warm_up(connections=min(threads, pool_size))
+    except Exception as e:
+        # the database may still be starting up, connect on first request instead
+        server.log.warning("Worker %s could not warm up connections: %s", worker.pid, e)
+    # invalidate this worker's caches when other workers write
+    app.listen_for_changes()
+    # exports, rate adjustments, summary rebuilds and delete purges
+    app.start_task_workers()
+
+
+def worker_exit(server, worker):
+    import app
+    if app.engine is not None:
+        app.engine.dispose()
@@ -0,0 +1,195 @@
+"""
+Per-request SQL instrumentation.
+
+Hooks SQLAlchemy's cursor events on the engine to count queries and time
+them, attributes that to the Flask request that ran them, and
+
+- adds a Server-Timing header (db time + query count, total app time),
+- writes a structured slow-query log line (normalized SQL, parameter shape;
+  a prepared statement's EXECUTE is logged with the SQL it was prepared from),
+- warns when one request runs suspiciously many queries (N+1 patterns),
+- keeps per-route histograms that /metrics exposes in Prometheus text format.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+QUERY_COUNT_WARNING = int(os.getenv('QUERY_COUNT_WARNING', '20'))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+slow_query_log = logging.getLogger('caregivers.slow_query')
+request_log = logging.getLogger('caregivers.requests')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w.$])-?\d+(?:\.\d+)?\b')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """Collapse whitespace and replace literals with ? so similar queries group together"""
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _NUMBER_LITERAL.sub('?', statement)
+    return _WHITESPACE.sub(' ', statement).strip()
+
+
+def parameter_shape(parameters, executemany=False):
+    """Types of the bound parameters, never their values"""
+    if executemany:
+        return {'executemany': len(parameters)}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class RouteMetrics:
+    """Histograms per route, shared by every request thread in the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.db_time = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+
+    def observe(self, route, seconds, db_seconds, query_count):
+        with self._lock:
+            self.latency[route].observe(seconds)
+            self.db_time[route].observe(db_seconds)
+            self.queries[route].observe(query_count)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, kind, families in (
+                ('caregivers_request_duration_seconds', 'request latency', self.latency),
+                ('caregivers_request_db_seconds', 'database time per request', self.db_time),
+                ('caregivers_request_db_queries', 'queries per request', self.queries),
+            ):
+                lines.append(f'# HELP {name} {kind} by route')
+                lines.append(f'# TYPE {name} histogram')
+                for route in sorted(families):
+                    hist = families[route]
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        lines.append(f'{name}_bucket{{route="{route}",le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{route="{route}",le="+Inf"}} {hist.total}')
+                    lines.append(f'{name}_sum{{route="{route}"}} {hist.sum:.6f}')
+                    lines.append(f'{name}_count{{route="{route}"}} {hist.total}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = RouteMetrics()
+
+# extra callables returning Prometheus text, appended to /metrics
+collectors = []
+
+# sql -> (prepared statement name or None, SQL to log); set by instrument()
+_describe_sql = None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    route = None
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + elapsed
+        route = request.endpoint
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        name, sql = _describe_sql(statement) if _describe_sql else (None, statement)
+        record = {
+            'event': 'slow_query',
+            'duration_ms': round(elapsed * 1000, 2),
+            'route': route,
+            'sql': normalize_sql(sql),
+            'params': parameter_shape(parameters, executemany),
+        }
+        if name:
+            record['statement'] = name
+        slow_query_log.warning(json.dumps(record))
+
+
+def _handle_error(context):
+    # after_cursor_execute doesn't fire for a failed statement
+    conn = context.connection
+    if conn is not None and conn.info.get('query_start'):
+        conn.info['query_start'].pop()
+
+
+def _before_request():
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0.0
+
+
+def _after_request(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    queries = g.get('db_queries', 0)
+    db_time = g.get('db_time', 0.0)
+    route = request.endpoint or 'unmatched'
+    response.headers.add('Server-Timing', f'db;dur={db_time * 1000:.2f};desc="{queries} queries"')
+    response.headers.add('Server-Timing', f'app;dur={elapsed * 1000:.2f}')
+    if route != 'metrics':
+        metrics.observe(route, elapsed, db_time, queries)
+    if queries > QUERY_COUNT_WARNING:
+        request_log.warning(json.dumps({
+            'event': 'many_queries',
+            'route': route,
+            'path': request.path,
+            'queries': queries,
+            'db_ms': round(db_time * 1000, 2),
+        }))
+    return response
+
+
+def render_metrics():
+    body = metrics.render() + ''.join(collect() for collect in collectors)
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+def instrument(app, engine, describe_sql=None):
+    """
+    Attach the engine listeners and request hooks, and add /metrics.
+    describe_sql(sql) -> (name, sql) names prepared statements in the slow-query log.
+    """
+    global _describe_sql
+    _describe_sql = describe_sql
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', render_metrics)
@@ -0,0 +1,117 @@
+"""
+Typeahead lookups for the caregiver, member and job fields in the forms.
+
+The forms used to list every id in a <select>, which at a few hundred
+thousand rows is megabytes of HTML. Now the field is a text input that asks
+/api/lookup/<kind>?q=... as you type and offers the best few matches.
+
+A query of digits is an exact id lookup. Anything else is a case-insensitive
+prefix match on the user's email, given name, surname or city ("anna sm"
+also matches given name + surname). Each of those is its own branch with its
+own LIMIT over a text_pattern_ops index
+(migrations/0007_lookup_prefix_indexes.sql), so however common the prefix,
+a lookup reads at most a few dozen index entries per branch. Users and
+members pending deletion (deletion.py) are never offered.
+"""
+
+import os
+
+import statements
+
+LOOKUP_LIMIT = int(os.getenv('LOOKUP_LIMIT', '10'))
+MAX_LOOKUP_LIMIT = 50
+
+KINDS = {
+    'caregivers': {
+        'source': 'FROM "user" u JOIN caregiver c ON c.caregiver_user_id = u.user_id',
+        'id': 'c.caregiver_user_id',
+        'live': 'u.deleted_at IS NULL',
+        'label': "u.given_name || ' ' || u.surname || ' · ' || c.caregiving_type || ' · ' || u.city",
+    },
+    'members': {
+        'source': 'FROM "user" u JOIN member m ON m.member_user_id = u.user_id',
+        'id': 'm.member_user_id',
+        'live': 'u.deleted_at IS NULL AND m.deleted_at IS NULL',
+        'label': "u.given_name || ' ' || u.surname || ' · ' || u.email || ' · ' || u.city",
+    },
+    # jobs are found by id or by the member who posted them
+    'jobs': {
+        'source': 'FROM "user" u JOIN job j ON j.member_user_id = u.user_id'
+                  ' JOIN member m ON m.member_user_id = j.member_user_id',
+        'id': 'j.job_id',
+        'live': 'u.deleted_at IS NULL AND m.deleted_at IS NULL',
+        'label': "j.required_caregiving_type || ' for ' || u.given_name || ' ' || u.surname"
+                 " || ' · ' || u.city || ' · posted ' || j.date_posted",
+    },
+}
+
+# (rank, condition); lower rank is listed first
+_BRANCHES = (
+    (0, 'lower(u.given_name) = :first AND lower(u.surname) LIKE :rest'),
+    (1, 'lower(u.email) LIKE :prefix'),
+    (2, 'lower(u.given_name) LIKE :prefix'),
+    (3, 'lower(u.surname) LIKE :prefix'),
+    (4, 'lower(u.city) LIKE :prefix'),
+)
+
+
+def _register(kind, spec):
+    branches = '\n        UNION ALL\n        '.join(
+        f"(SELECT {spec['id']} AS id, {spec['label']} AS label, {rank} AS rank\n"
+        f"         {spec['source']} WHERE {condition} AND {spec['live']} LIMIT :limit)"
+        for rank, condition in _BRANCHES
+    )
+    statements.register(f'lookup_{kind}', f"""
+        SELECT id, label FROM (
+            SELECT DISTINCT ON (id) id, label, rank FROM (
+        {branches}
+            ) hits
+            ORDER BY id, rank
+        ) best
+        ORDER BY rank, label
+        LIMIT :limit
+    """)
+    statements.register(f'lookup_{kind}_by_id', f"""
+        SELECT {spec['id']} AS id, {spec['label']} AS label
+        {spec['source']}
+        WHERE {spec['id']} = :id AND {spec['live']}
+    """)
+
+
+for _kind, _spec in KINDS.items():
+    _register(_kind, _spec)
+
+
+def _like_prefix(value):
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+
+def parse_limit(args):
+    try:
+        limit = int(args.get('limit', LOOKUP_LIMIT))
+    except (TypeError, ValueError):
+        limit = LOOKUP_LIMIT
+    return max(1, min(limit, MAX_LOOKUP_LIMIT))
+
+
+def lookup(session, kind, q, limit=LOOKUP_LIMIT):
+    """Best matches for what was typed so far, as [{'id': ..., 'label': ...}]"""
+    q = ' '.join(q.split()).lower()
+    if not q:
+        return []
+    # isdigit() would let through characters like "²" that int() rejects
+    if q.isascii() and q.isdigit():
+        # ids are int4; anything bigger can't match
+        if int(q) > 2147483647:
+            return []
+        rows = statements.execute(session, f'lookup_{kind}_by_id', {'id': int(q)})
+    else:
+        first, _, rest = q.partition(' ')
+        rows = statements.execute(session, f'lookup_{kind}', {
+            'prefix': _like_prefix(q),
+            'first': first,
+            'rest': _like_prefix(rest),
+            'limit': limit,
+        })
+    return [{'id': row.id, 'label': row.label} for row in rows]
@@ -0,0 +1,315 @@
+"""
+Caregiver shortlists for a job.
+
+Every caregiver is kept in memory in a compact, array-backed index
+partitioned by (caregiving type, city), each partition sorted by hourly
+rate. A shortlist only looks at the partitions for the job's type and the
+member's city / address town, cuts them to the requested rate bounds with a
+binary search, and walks the candidates best score first. Candidates are
+checked against the database in batches (conflicting confirmed appointments
+in the requested time window, see availability.py), so a shortlist costs a few small indexed
+queries however many caregivers there are.
+
+Caregiver writes in this process update the index in place; the TTL bounds
+how stale it can get after writes from other processes (imports, datagen).
+
+Score: city match (1.0 home city, 0.9 address town) + 0.5 if the caregiver
+already applied to the job + up to 1.0 for being cheaper within the bounds.
+"""
+
+import os
+import sys
+import threading
+import time as clock
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta
+from heapq import merge
+
+from sqlalchemy import text
+
+from availability import busy_ids
+
+MATCH_INDEX_TTL = float(os.getenv('MATCH_INDEX_TTL', '600'))
+MATCH_BATCH_SIZE = int(os.getenv('MATCH_BATCH_SIZE', '200'))
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+
+HOME_CITY_WEIGHT = 1.0
+TOWN_WEIGHT = 0.9
+APPLIED_BONUS = 0.5
+RATE_WEIGHT = 1.0
+
+NOT_INDEXED = -1
+
+
+def _city_key(city):
+    return sys.intern(city.strip().casefold()) if city else ''
+
+
+class _Partition:
+    """Caregiver ids and rates as parallel arrays, sorted by rate"""
+
+    __slots__ = ('rates', 'ids')
+
+    def __init__(self):
+        self.rates = array('d')
+        self.ids = array('i')
+
+    def add(self, rate, caregiver_id):
+        i = bisect_right(self.rates, rate)
+        self.rates.insert(i, rate)
+        self.ids.insert(i, caregiver_id)
+
+    def remove(self, caregiver_id):
+        i = self.ids.index(caregiver_id)
+        del self.rates[i]
+        del self.ids[i]
+
+    def rate_of(self, caregiver_id):
+        return self.rates[self.ids.index(caregiver_id)]
+
+    def between(self, min_rate, max_rate):
+        """Copies of the (rates, ids) slice within the bounds"""
+        lo = 0 if min_rate is None else bisect_left(self.rates, min_rate)
+        hi = len(self.rates) if max_rate is None else bisect_right(self.rates, max_rate)
+        return self.rates[lo:hi], self.ids[lo:hi]
+
+
+class _Snapshot:
+    def __init__(self):
+        self.partitions = {}
+        self.keys = []
+        # partition number per caregiver id, NOT_INDEXED if none
+        self.where = array('h')
+
+    def partition_for(self, key):
+        number = self.partitions.get(key)
+        if number is None:
+            number = self.partitions[key] = len(self.keys)
+            self.keys.append((key, _Partition()))
+        return self.keys[number][1], number
+
+    def place(self, caregiver_id, number):
+        if caregiver_id >= len(self.where):
+            self.where.extend([NOT_INDEXED] * (caregiver_id + 1 - len(self.where)))
+        self.where[caregiver_id] = number
+
+    def add(self, caregiver_id, caregiving_type, city, rate):
+        partition, number = self.partition_for((sys.intern(caregiving_type), _city_key(city)))
+        partition.add(rate, caregiver_id)
+        self.place(caregiver_id, number)
+
+    def remove(self, caregiver_id):
+        if caregiver_id < len(self.where) and self.where[caregiver_id] != NOT_INDEXED:
+            self.keys[self.where[caregiver_id]][1].remove(caregiver_id)
+            self.where[caregiver_id] = NOT_INDEXED
+
+    def __len__(self):
+        return sum(len(partition.ids) for _, partition in self.keys)
+
+
+LOAD_QUERY = """
+    SELECT c.caregiver_user_id, c.caregiving_type, u.city, c.hourly_rate
+    FROM caregiver c
+    JOIN "user" u ON u.user_id = c.caregiver_user_id
+    WHERE u.deleted_at IS NULL
+"""
+
+
+class CaregiverIndex:
+    def __init__(self, ttl=MATCH_INDEX_TTL):
+        self.ttl = ttl
+        self._snapshot = None
+        self._loaded_at = None
+        self._stale = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def ensure_loaded(self, session):
+        if self._snapshot is not None and not self._expired():
+            return
+        with self._load_lock:
+            if self._snapshot is None or self._expired():
+                self.load(session)
+
+    def _expired(self):
+        return self._stale or self.ttl is not None and clock.monotonic() - self._loaded_at > self.ttl
+
+    def load(self, session):
+        """Rebuild from the database and swap the new index in"""
+        started = clock.monotonic()
+        snapshot = _Snapshot()
+        result = session.execute(text(LOAD_QUERY + " ORDER BY c.hourly_rate, c.caregiver_user_id"),
+                                 execution_options={'yield_per': 10000})
+        for caregiver_id, caregiving_type, city, rate in result:
+            # rows arrive in rate order, so appending keeps partitions sorted
+            partition, number = snapshot.partition_for((sys.intern(caregiving_type), _city_key(city)))
+            partition.rates.append(float(rate))
+            partition.ids.append(caregiver_id)
+            snapshot.place(caregiver_id, number)
+        with self._lock:
+            self._snapshot = snapshot
+            self._loaded_at = started
+            self._stale = False
+
+    def invalidate(self):
+        """Reload on next use (e.g. after a bulk import)"""
+        self._stale = True
+
+    def refresh(self, session, caregiver_id):
+        """Re-read one caregiver after a write; drops it if it no longer exists"""
+        if self._snapshot is None:
+            return
+        row = session.execute(text(LOAD_QUERY + " AND c.caregiver_user_id = :id"),
+                              {'id': caregiver_id}).fetchone()
+        with self._lock:
+            self._snapshot.remove(caregiver_id)
+            if row is not None:
+                self._snapshot.add(row.caregiver_user_id, row.caregiving_type, row.city, float(row.hourly_rate))
+
+    def remove(self, caregiver_id):
+        with self._lock:
+            if self._snapshot is not None:
+                self._snapshot.remove(caregiver_id)
+
+    def __len__(self):
+        return len(self._snapshot) if self._snapshot is not None else 0
+
+    def candidates(self, caregiving_type, cities, min_rate=None, max_rate=None, applicants=()):
+        """
+        Candidates as (score, caregiver_id, rate, applied), best first.
+        cities is a list of (city, weight). The slices are copied under the
+        lock so writes can carry on while the caller walks them.
+        """
+        slices = []
+        with self._lock:
+            snapshot = self._snapshot
+            for city, weight in cities:
+                number = snapshot.partitions.get((caregiving_type, _city_key(city)))
+                if number is not None:
+                    slices.append((weight, *snapshot.keys[number][1].between(min_rate, max_rate)))
+            applied = []
+            numbers = {snapshot.partitions.get((caregiving_type, _city_key(city))): weight
+                       for city, weight in cities}
+            for caregiver_id in applicants:
+                number = snapshot.where[caregiver_id] if caregiver_id < len(snapshot.where) else NOT_INDEXED
+                if number != NOT_INDEXED and number in numbers:
+                    rate = snapshot.keys[number][1].rate_of(caregiver_id)
+                    if (min_rate is None or rate >= min_rate) and (max_rate is None or rate <= max_rate):
+                        applied.append((numbers[number], rate, caregiver_id))
+
+        ceiling = max_rate
+        if ceiling is None:
+            ceiling = max([rates[-1] for _, rates, _ in slices if rates] + [rate for _, rate, _ in applied] + [1.0])
+
+        def rate_score(rate):
+            return RATE_WEIGHT * (1 - rate / ceiling) if ceiling > 0 else 0.0
+
+        # applicants come out of the applied stream, with their bonus, only
+        applied_ids = {caregiver_id for _, _, caregiver_id in applied}
+
+        def walk(weight, rates, ids):
+            for rate, caregiver_id in zip(rates, ids):
+                if caregiver_id not in applied_ids:
+                    yield weight + rate_score(rate), caregiver_id, rate, False
+
+        streams = [walk(weight, rates, ids) for weight, rates, ids in slices]
+        streams.append(sorted(((weight + APPLIED_BONUS + rate_score(rate), caregiver_id, rate, True)
+                               for weight, rate, caregiver_id in applied), key=lambda c: -c[0]))
+        return merge(*streams, key=lambda c: -c[0])
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_job(session, job_id):
+    row = session.execute(text("""
+        SELECT j.job_id, j.member_user_id, j.required_caregiving_type, j.other_requirements, j.date_posted,
+               u.given_name, u.surname, u.city, a.town
+        FROM job j
+        JOIN "user" u ON u.user_id = j.member_user_id
+        LEFT JOIN address a ON a.member_user_id = j.member_user_id
+        WHERE j.job_id = :job_id
+    """), {'job_id': job_id}).fetchone()
+    return dict(row._mapping) if row else None
+
+
+def parse_criteria(args):
+    """Rate bounds, time window and limit from request args; ValueError on junk"""
+    def rate(name):
+        value = args.get(name, '').strip()
+        if not value:
+            return None
+        value = float(value)
+        if value < 0:
+            raise ValueError(f"{name} must not be negative")
+        return value
+
+    criteria = {'min_rate': rate('min_rate'), 'max_rate': rate('max_rate'), 'window': None}
+    day = args.get('date', '').strip()
+    if day:
+        starts = datetime.combine(date.fromisoformat(day), time.fromisoformat(args.get('time') or '00:00'))
+        hours = float(args.get('hours') or 24)
+        if not 0 < hours <= 24:
+            raise ValueError("hours must be between 0 and 24")
+        criteria['window'] = (starts, starts + timedelta(hours=hours))
+    limit = int(args.get('limit') or DEFAULT_LIMIT)
+    criteria['limit'] = max(1, min(limit, MAX_LIMIT))
+    return criteria
+
+
+def shortlist(session, index, job, min_rate=None, max_rate=None, window=None, limit=DEFAULT_LIMIT):
+    """The best `limit` caregivers for a job (as returned by load_job)"""
+    index.ensure_loaded(session)
+    cities = [(job['city'], HOME_CITY_WEIGHT)]
+    if job['town'] and _city_key(job['town']) != _city_key(job['city']):
+        cities.append((job['town'], TOWN_WEIGHT))
+    applicants = session.execute(text(
+        "SELECT caregiver_user_id FROM job_application WHERE job_id = :job_id"), {'job_id': job['job_id']}
+    ).scalars().all()
+
+    picked = []
+    seen = set()
+    for batch in _batches(index.candidates(job['required_caregiving_type'], cities, min_rate, max_rate,
+                                           applicants), max(MATCH_BATCH_SIZE, limit)):
+        # checked per candidate: duplicates can sit in the same batch
+        fresh = []
+        for c in batch:
+            if c[1] not in seen:
+                seen.add(c[1])
+                fresh.append(c)
+        batch = fresh
+        busy = busy_ids(session, [c[1] for c in batch], *window) if window and batch else set()
+        picked.extend(c for c in batch if c[1] not in busy)
+        if len(picked) >= limit:
+            break
+    picked = picked[:limit]
+    if not picked:
+        return []
+
+    details = {row.caregiver_user_id: row for row in session.execute(text("""
+        SELECT c.caregiver_user_id, c.gender, c.caregiving_type, u.given_name, u.surname, u.city,
+               u.email, u.phone_number
+        FROM caregiver c
+        JOIN "user" u ON u.user_id = c.caregiver_user_id
+        WHERE c.caregiver_user_id = ANY(:ids)
+    """), {'ids': [c[1] for c in picked]})}
+    matches = []
+    for score, caregiver_id, rate, applied in picked:
+        row = details.get(caregiver_id)
+        if row is None:
+            # deleted by another process since the index was loaded
+            continue
+        match = dict(row._mapping)
+        match.update(hourly_rate=rate, score=round(score, 3), applied=applied)
+        matches.append(match)
+    return matches
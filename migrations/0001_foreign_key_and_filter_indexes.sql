@@ -0,0 +1,35 @@
+-- migrate: no-transaction
+-- Indexes for the foreign keys used in every join in app.py and for the
+-- filters in database_queries.py. Built CONCURRENTLY so a live database
+-- keeps taking writes while they build.
+
+-- foreign keys (Postgres does not index the referencing side on its own)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS job_member_user_id_idx
+    ON job (member_user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS job_application_job_id_idx
+    ON job_application (job_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS appointment_caregiver_date_idx
+    ON appointment (caregiver_user_id, appointment_date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS appointment_member_user_id_idx
+    ON appointment (member_user_id);
+
+-- confirmed appointments by caregiver (queries 5.1, 6.2 - 6.4, 7)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS appointment_confirmed_caregiver_idx
+    ON appointment (caregiver_user_id) INCLUDE (work_hours)
+    WHERE status = 'confirmed';
+
+-- keyset order of the appointments list page
+CREATE INDEX CONCURRENTLY IF NOT EXISTS appointment_schedule_idx
+    ON appointment (appointment_date, appointment_time, appointment_id);
+
+-- filters
+CREATE INDEX CONCURRENTLY IF NOT EXISTS caregiver_caregiving_type_idx
+    ON caregiver (caregiving_type, hourly_rate);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS job_required_type_member_idx
+    ON job (required_caregiving_type, member_user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS address_street_idx
+    ON address (street);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_city_idx
+    ON "user" (city);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_name_idx
+    ON "user" (given_name, surname);
@@ -0,0 +1,26 @@
+-- migrate: no-transaction
+-- Keyword search over job requirements and member/user profiles.
+--
+-- Full text: GIN indexes on the same to_tsvector() expressions search.py
+-- queries with, so they stay in sync on every insert/update without a stored
+-- column (and without rewriting the tables to add one).
+-- Trigram: lets the existing LIKE '%...%' filters (queries 5.2 and 5.4 in
+-- database_queries.py) use an index instead of scanning every row.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS job_other_requirements_fts_idx
+    ON job USING gin (to_tsvector('english', coalesce(other_requirements, '')));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS member_profile_fts_idx
+    ON member USING gin (to_tsvector('english', coalesce(house_rules, '') || ' ' || coalesce(dependent_description, '')));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_profile_description_fts_idx
+    ON "user" USING gin (to_tsvector('english', coalesce(profile_description, '')));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS job_other_requirements_trgm_idx
+    ON job USING gin (other_requirements gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS member_house_rules_trgm_idx
+    ON member USING gin (house_rules gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS member_dependent_description_trgm_idx
+    ON member USING gin (dependent_description gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_profile_description_trgm_idx
+    ON "user" USING gin (profile_description gin_trgm_ops);
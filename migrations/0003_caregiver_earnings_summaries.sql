@@ -0,0 +1,168 @@
+-- Materialized earnings summaries for queries 6.2, 6.3 and 6.4, kept up to
+-- date by triggers on appointment and caregiver instead of being recomputed
+-- from the whole confirmed-appointment set.
+--
+-- caregiver_earnings_summary: one row per caregiver (6.4)
+-- platform_earnings_summary: platform totals (6.2, 6.3), split over 16 slots
+--   by caregiver_user_id so concurrent confirmations for different
+--   caregivers don't all queue up on one row. Readers SUM the 16 rows.
+--
+-- Earnings use the caregiver's current hourly_rate, same as the original
+-- queries, so a rate change re-prices that caregiver's confirmed hours.
+-- Creating the triggers locks both tables against writes until this
+-- migration commits, so the backfill below can't miss or double count.
+
+CREATE TABLE caregiver_earnings_summary (
+    caregiver_user_id INTEGER PRIMARY KEY,
+    hourly_rate DECIMAL(10, 2) NOT NULL,
+    confirmed_appointments INTEGER NOT NULL DEFAULT 0,
+    confirmed_hours DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    total_earnings DECIMAL(18, 4) NOT NULL DEFAULT 0
+);
+
+CREATE INDEX caregiver_earnings_summary_earnings_idx
+    ON caregiver_earnings_summary (total_earnings, caregiver_user_id);
+
+CREATE TABLE platform_earnings_summary (
+    slot SMALLINT PRIMARY KEY CHECK (slot >= 0 AND slot < 16),
+    confirmed_appointments BIGINT NOT NULL DEFAULT 0,
+    total_hours NUMERIC NOT NULL DEFAULT 0,
+    total_pay NUMERIC NOT NULL DEFAULT 0
+);
+
+INSERT INTO platform_earnings_summary (slot)
+SELECT generate_series(0, 15);
+
+CREATE OR REPLACE FUNCTION appointment_earnings_trigger() RETURNS trigger AS $$
+DECLARE
+    v_rate DECIMAL(10, 2);
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'confirmed' THEN
+        UPDATE caregiver_earnings_summary
+        SET confirmed_appointments = confirmed_appointments - 1,
+            confirmed_hours = confirmed_hours - OLD.work_hours,
+            total_earnings = total_earnings - OLD.work_hours * hourly_rate
+        WHERE caregiver_user_id = OLD.caregiver_user_id
+        RETURNING hourly_rate INTO v_rate;
+        IF FOUND THEN
+            UPDATE platform_earnings_summary
+            SET confirmed_appointments = confirmed_appointments - 1,
+                total_hours = total_hours - OLD.work_hours,
+                total_pay = total_pay - OLD.work_hours * v_rate
+            WHERE slot = OLD.caregiver_user_id % 16;
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'confirmed' THEN
+        UPDATE caregiver_earnings_summary
+        SET confirmed_appointments = confirmed_appointments + 1,
+            confirmed_hours = confirmed_hours + NEW.work_hours,
+            total_earnings = total_earnings + NEW.work_hours * hourly_rate
+        WHERE caregiver_user_id = NEW.caregiver_user_id
+        RETURNING hourly_rate INTO v_rate;
+        IF FOUND THEN
+            UPDATE platform_earnings_summary
+            SET confirmed_appointments = confirmed_appointments + 1,
+                total_hours = total_hours + NEW.work_hours,
+                total_pay = total_pay + NEW.work_hours * v_rate
+            WHERE slot = NEW.caregiver_user_id % 16;
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION caregiver_earnings_trigger() RETURNS trigger AS $$
+DECLARE
+    v_count INTEGER;
+    v_hours DECIMAL(14, 2);
+    v_earnings DECIMAL(18, 4);
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO caregiver_earnings_summary (caregiver_user_id, hourly_rate)
+        VALUES (NEW.caregiver_user_id, NEW.hourly_rate)
+        ON CONFLICT (caregiver_user_id) DO NOTHING;
+    ELSIF TG_OP = 'UPDATE' THEN
+        UPDATE caregiver_earnings_summary
+        SET hourly_rate = NEW.hourly_rate,
+            total_earnings = confirmed_hours * NEW.hourly_rate
+        WHERE caregiver_user_id = NEW.caregiver_user_id
+        RETURNING confirmed_hours INTO v_hours;
+        IF FOUND AND v_hours <> 0 THEN
+            UPDATE platform_earnings_summary
+            SET total_pay = total_pay + (NEW.hourly_rate - OLD.hourly_rate) * v_hours
+            WHERE slot = NEW.caregiver_user_id % 16;
+        END IF;
+    ELSE
+        -- normally the cascade has already deleted (and subtracted) this
+        -- caregiver's appointments, but take whatever is left off the
+        -- platform totals so the result doesn't depend on trigger order
+        DELETE FROM caregiver_earnings_summary
+        WHERE caregiver_user_id = OLD.caregiver_user_id
+        RETURNING confirmed_appointments, confirmed_hours, total_earnings
+        INTO v_count, v_hours, v_earnings;
+        IF FOUND AND v_count <> 0 THEN
+            UPDATE platform_earnings_summary
+            SET confirmed_appointments = confirmed_appointments - v_count,
+                total_hours = total_hours - v_hours,
+                total_pay = total_pay - v_earnings
+            WHERE slot = OLD.caregiver_user_id % 16;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER appointment_earnings_insert
+    AFTER INSERT ON appointment
+    FOR EACH ROW WHEN (NEW.status = 'confirmed')
+    EXECUTE FUNCTION appointment_earnings_trigger();
+
+CREATE TRIGGER appointment_earnings_update
+    AFTER UPDATE OF status, work_hours, caregiver_user_id ON appointment
+    FOR EACH ROW WHEN (OLD.status = 'confirmed' OR NEW.status = 'confirmed')
+    EXECUTE FUNCTION appointment_earnings_trigger();
+
+CREATE TRIGGER appointment_earnings_delete
+    AFTER DELETE ON appointment
+    FOR EACH ROW WHEN (OLD.status = 'confirmed')
+    EXECUTE FUNCTION appointment_earnings_trigger();
+
+CREATE TRIGGER caregiver_earnings_insert
+    AFTER INSERT ON caregiver
+    FOR EACH ROW EXECUTE FUNCTION caregiver_earnings_trigger();
+
+CREATE TRIGGER caregiver_earnings_rate_update
+    AFTER UPDATE OF hourly_rate ON caregiver
+    FOR EACH ROW WHEN (OLD.hourly_rate IS DISTINCT FROM NEW.hourly_rate)
+    EXECUTE FUNCTION caregiver_earnings_trigger();
+
+CREATE TRIGGER caregiver_earnings_delete
+    AFTER DELETE ON caregiver
+    FOR EACH ROW EXECUTE FUNCTION caregiver_earnings_trigger();
+
+-- backfill from the current data
+INSERT INTO caregiver_earnings_summary
+    (caregiver_user_id, hourly_rate, confirmed_appointments, confirmed_hours, total_earnings)
+SELECT c.caregiver_user_id, c.hourly_rate,
+       COUNT(a.appointment_id),
+       COALESCE(SUM(a.work_hours), 0),
+       COALESCE(SUM(a.work_hours), 0) * c.hourly_rate
+FROM caregiver c
+LEFT JOIN appointment a ON a.caregiver_user_id = c.caregiver_user_id AND a.status = 'confirmed'
+GROUP BY c.caregiver_user_id, c.hourly_rate;
+
+UPDATE platform_earnings_summary p
+SET confirmed_appointments = s.confirmed_appointments,
+    total_hours = s.total_hours,
+    total_pay = s.total_pay
+FROM (
+    SELECT caregiver_user_id % 16 AS slot,
+           SUM(confirmed_appointments) AS confirmed_appointments,
+           SUM(confirmed_hours) AS total_hours,
+           SUM(total_earnings) AS total_pay
+    FROM caregiver_earnings_summary
+    GROUP BY caregiver_user_id % 16
+) s
+WHERE p.slot = s.slot;
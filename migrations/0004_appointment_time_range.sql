@@ -0,0 +1,24 @@
+-- Appointment start/end as one tsrange column, so "who is busy between X
+-- and Y" is an indexed range-overlap test instead of date + time +
+-- work_hours arithmetic on every row.
+--
+-- time_range is a stored generated column: it can't drift from the columns
+-- it's derived from and the existing INSERT/UPDATE statements don't change.
+-- Adding it rewrites appointment once, under an exclusive lock.
+--
+-- The exclusion constraint stops a caregiver from having two overlapping
+-- confirmed appointments; its partial GiST index on (caregiver_user_id,
+-- time_range) is also what the availability queries use.
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE appointment
+    ADD COLUMN time_range tsrange GENERATED ALWAYS AS (
+        tsrange(appointment_date + appointment_time,
+                appointment_date + appointment_time + CAST(work_hours AS double precision) * interval '1 hour')
+    ) STORED;
+
+ALTER TABLE appointment
+    ADD CONSTRAINT appointment_confirmed_no_overlap
+    EXCLUDE USING gist (caregiver_user_id WITH =, time_range WITH &&)
+    WHERE (status = 'confirmed');
@@ -0,0 +1,69 @@
+-- book_appointment(): conflict check and insert for one appointment in a
+-- single call, serialized per caregiver.
+--
+-- Bookings for the same caregiver take a transaction-level advisory lock
+-- (class 341002, key = caregiver id), waiting at most p_lock_wait_ms for it.
+-- If it's still held the call returns 'busy' straight away instead of
+-- queueing more transactions behind it. The overlap check runs after the
+-- lock is held, so it sees every booking committed before it; plpgsql takes
+-- a fresh snapshot per statement.
+--
+-- outcome is 'booked' (booked_id set), 'conflict' (conflict_id is the
+-- pending or confirmed appointment in the way) or 'busy'. The lock is
+-- released when the caller's transaction ends.
+
+CREATE OR REPLACE FUNCTION book_appointment(
+    p_caregiver_user_id INTEGER,
+    p_member_user_id INTEGER,
+    p_appointment_date DATE,
+    p_appointment_time TIME,
+    p_work_hours DECIMAL,
+    p_status VARCHAR,
+    p_lock_wait_ms INTEGER DEFAULT 0,
+    OUT outcome TEXT,
+    OUT booked_id INTEGER,
+    OUT conflict_id INTEGER
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_range tsrange := tsrange(p_appointment_date + p_appointment_time,
+                               p_appointment_date + p_appointment_time
+                               + CAST(p_work_hours AS double precision) * interval '1 hour');
+    v_lock_timeout TEXT;
+BEGIN
+    IF p_lock_wait_ms > 0 THEN
+        v_lock_timeout := current_setting('lock_timeout');
+        PERFORM set_config('lock_timeout', p_lock_wait_ms || 'ms', true);
+        BEGIN
+            PERFORM pg_advisory_xact_lock(341002, p_caregiver_user_id);
+        EXCEPTION WHEN lock_not_available THEN
+            PERFORM set_config('lock_timeout', v_lock_timeout, true);
+            outcome := 'busy';
+            RETURN;
+        END;
+        PERFORM set_config('lock_timeout', v_lock_timeout, true);
+    ELSIF NOT pg_try_advisory_xact_lock(341002, p_caregiver_user_id) THEN
+        outcome := 'busy';
+        RETURN;
+    END IF;
+
+    IF p_status IN ('pending', 'confirmed') THEN
+        SELECT a.appointment_id INTO conflict_id
+        FROM appointment a
+        WHERE a.caregiver_user_id = p_caregiver_user_id
+          AND a.status IN ('pending', 'confirmed')
+          AND a.time_range && v_range
+        LIMIT 1;
+        IF FOUND THEN
+            outcome := 'conflict';
+            RETURN;
+        END IF;
+    END IF;
+
+    INSERT INTO appointment (caregiver_user_id, member_user_id, appointment_date, appointment_time,
+                             work_hours, status)
+    VALUES (p_caregiver_user_id, p_member_user_id, p_appointment_date, p_appointment_time,
+            p_work_hours, p_status)
+    RETURNING appointment_id INTO booked_id;
+    outcome := 'booked';
+END;
+$$;
@@ -0,0 +1,66 @@
+-- Change notifications for cross-process cache invalidation.
+--
+-- Every INSERT/UPDATE/DELETE/TRUNCATE statement on the seven tables sends
+-- one NOTIFY on channel table_changes with a compact JSON payload:
+--
+--   {"t": "caregiver", "op": "UPDATE", "ids": [12, 15]}
+--
+-- ids holds the primary keys of the affected rows ([caregiver, job] pairs
+-- for job_application), or is null when the statement touched more than
+-- 100 rows (or was a TRUNCATE), meaning "assume anything in the table
+-- changed". The triggers are statement-level and read the transition tables,
+-- so a bulk write costs one notification, not one per row. Notifications are
+-- only delivered on commit, and Postgres drops exact duplicates within a
+-- transaction.
+
+CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    v_ids json;
+BEGIN
+    IF TG_OP <> 'TRUNCATE' THEN
+        -- TG_ARGV[0] is the primary key expression
+        EXECUTE format('SELECT json_agg(k) FROM (SELECT %s AS k FROM %I LIMIT 101) r',
+                       TG_ARGV[0], CASE WHEN TG_OP = 'DELETE' THEN 'old_rows' ELSE 'new_rows' END)
+            INTO v_ids;
+        IF v_ids IS NULL THEN
+            -- statement matched no rows
+            RETURN NULL;
+        END IF;
+        IF json_array_length(v_ids) > 100 THEN
+            v_ids := NULL;
+        END IF;
+    END IF;
+    PERFORM pg_notify('table_changes', json_build_object('t', TG_TABLE_NAME, 'op', TG_OP, 'ids', v_ids)::text);
+    RETURN NULL;
+END;
+$$;
+
+DO $$
+DECLARE
+    v_table TEXT;
+    v_key TEXT;
+BEGIN
+    FOR v_table, v_key IN VALUES
+        ('user', 'user_id'),
+        ('caregiver', 'caregiver_user_id'),
+        ('member', 'member_user_id'),
+        ('address', 'member_user_id'),
+        ('job', 'job_id'),
+        ('job_application', 'json_build_array(caregiver_user_id, job_id)'),
+        ('appointment', 'appointment_id')
+    LOOP
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows
+                        FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change(%L)',
+                       v_table || '_notify_insert', v_table, v_key);
+        EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING NEW TABLE AS new_rows
+                        FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change(%L)',
+                       v_table || '_notify_update', v_table, v_key);
+        EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows
+                        FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change(%L)',
+                       v_table || '_notify_delete', v_table, v_key);
+        EXECUTE format('CREATE TRIGGER %I AFTER TRUNCATE ON %I
+                        FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change()',
+                       v_table || '_notify_truncate', v_table);
+    END LOOP;
+END;
+$$;
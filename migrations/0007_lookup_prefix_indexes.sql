@@ -0,0 +1,14 @@
+-- migrate: no-transaction
+-- Prefix indexes behind the typeahead lookups (lookup.py, /api/lookup/...):
+-- lower(column) LIKE 'abc%' turns into an index range scan with
+-- text_pattern_ops whatever the database collation, so each keystroke reads
+-- a handful of index entries instead of scanning "user".
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_email_prefix_idx
+    ON "user" (lower(email) text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_given_name_prefix_idx
+    ON "user" (lower(given_name) text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_surname_prefix_idx
+    ON "user" (lower(surname) text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_city_prefix_idx
+    ON "user" (lower(city) text_pattern_ops);
@@ -0,0 +1,245 @@
+-- appointment as a table range-partitioned by appointment_date, one
+-- partition per month, so date-bounded queries only read the months they
+-- ask for and old months can be moved out whole (partitions.py).
+--
+-- Partitions are named appointment_YYYY_MM and cover [first of the month,
+-- first of the next month). appointment_default catches any date without a
+-- partition, so an insert never fails for want of one;
+-- appointment_ensure_partitions() moves such rows into proper partitions.
+-- Every month from the oldest appointment to a year ahead is created here;
+-- after that `python partitions.py ensure` (also run when gunicorn starts)
+-- keeps a year of future partitions around, and `python partitions.py
+-- archive` detaches old months into appointment_archive.
+--
+-- The partition key has to be part of the primary key, which becomes
+-- (appointment_id, appointment_date); appointment_id still comes from the
+-- same sequence and stays unique on its own. Exclusion constraints can't be
+-- declared on a partitioned table, so appointment_confirmed_no_overlap
+-- turns into one constraint per partition. It no longer catches two
+-- confirmed appointments that start in different months and overlap across
+-- the month boundary; book_appointment() still rejects those (it checks
+-- for overlaps itself), edits through the appointment form don't.
+--
+-- This rebuilds appointment under an exclusive lock (every row is copied
+-- once). Needs PostgreSQL 14+ for `DETACH PARTITION ... CONCURRENTLY` in
+-- partitions.py.
+
+ALTER TABLE appointment RENAME TO appointment_unpartitioned;
+
+CREATE TABLE appointment (
+    appointment_id INTEGER NOT NULL DEFAULT nextval('appointment_appointment_id_seq'),
+    caregiver_user_id INTEGER NOT NULL,
+    member_user_id INTEGER NOT NULL,
+    appointment_date DATE NOT NULL,
+    appointment_time TIME NOT NULL,
+    work_hours DECIMAL(4, 2) NOT NULL CHECK (work_hours > 0),
+    status VARCHAR(20) NOT NULL CHECK (status IN ('pending', 'confirmed', 'declined', 'completed')),
+    time_range tsrange GENERATED ALWAYS AS (
+        tsrange(appointment_date + appointment_time,
+                appointment_date + appointment_time + CAST(work_hours AS double precision) * interval '1 hour')
+    ) STORED,
+    FOREIGN KEY (caregiver_user_id) REFERENCES caregiver(caregiver_user_id) ON DELETE CASCADE,
+    FOREIGN KEY (member_user_id) REFERENCES member(member_user_id) ON DELETE CASCADE
+) PARTITION BY RANGE (appointment_date);
+
+ALTER SEQUENCE appointment_appointment_id_seq OWNED BY appointment.appointment_id;
+
+-- same shape, no foreign key checks on the way in; partitions.py attaches
+-- detached months here (they keep their own foreign keys and indexes)
+CREATE TABLE appointment_archive (
+    LIKE appointment INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED
+) PARTITION BY RANGE (appointment_date);
+
+CREATE OR REPLACE FUNCTION appointment_create_partition(p_month DATE) RETURNS TEXT LANGUAGE plpgsql AS $$
+DECLARE
+    v_from DATE := CAST(date_trunc('month', p_month) AS DATE);
+    v_to DATE := CAST(date_trunc('month', p_month) + interval '1 month' AS DATE);
+    v_name TEXT := 'appointment_' || to_char(p_month, 'YYYY_MM');
+BEGIN
+    IF to_regclass(v_name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+    -- built on its own and attached, which only takes a SHARE UPDATE
+    -- EXCLUSIVE lock on appointment instead of blocking reads and writes
+    EXECUTE format('CREATE TABLE %I (LIKE appointment INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)',
+                   v_name);
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I
+                    EXCLUDE USING gist (caregiver_user_id WITH =, time_range WITH &&) WHERE (status = ''confirmed'')',
+                   v_name, v_name || '_confirmed_no_overlap');
+    -- lets ATTACH (here and into appointment_archive) skip scanning the rows
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I CHECK (appointment_date >= %L AND appointment_date < %L)',
+                   v_name, v_name || '_bounds', v_from, v_to);
+
+    IF EXISTS (SELECT 1 FROM appointment_default WHERE appointment_date >= v_from AND appointment_date < v_to) THEN
+        -- rows for this month went to the default partition before this one
+        -- existed. Move them while the default partition is detached so the
+        -- row triggers (earnings summaries) don't see a delete and an insert
+        -- of what is the same appointment.
+        ALTER TABLE appointment DETACH PARTITION appointment_default;
+        EXECUTE format('WITH moved AS (
+                            DELETE FROM appointment_default WHERE appointment_date >= $1 AND appointment_date < $2
+                            RETURNING *
+                        )
+                        INSERT INTO %I (appointment_id, caregiver_user_id, member_user_id, appointment_date,
+                                        appointment_time, work_hours, status)
+                        SELECT appointment_id, caregiver_user_id, member_user_id, appointment_date,
+                               appointment_time, work_hours, status
+                        FROM moved', v_name)
+            USING v_from, v_to;
+        EXECUTE format('ALTER TABLE appointment ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                       v_name, v_from, v_to);
+        ALTER TABLE appointment ATTACH PARTITION appointment_default DEFAULT;
+    ELSE
+        EXECUTE format('ALTER TABLE appointment ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                       v_name, v_from, v_to);
+    END IF;
+    RETURN v_name;
+END;
+$$;
+
+-- partitions for every month from p_from to p_to, plus every month that
+-- has rows in the default partition; returns the ones it created
+CREATE OR REPLACE FUNCTION appointment_ensure_partitions(p_from DATE, p_to DATE)
+RETURNS SETOF TEXT LANGUAGE plpgsql AS $$
+DECLARE
+    v_months DATE[];
+    v_month DATE;
+    v_name TEXT;
+BEGIN
+    -- collected up front: creating a partition may detach appointment_default
+    SELECT array_agg(month ORDER BY month) INTO v_months
+    FROM (
+        SELECT generate_series(date_trunc('month', p_from), date_trunc('month', p_to), interval '1 month')::date
+        UNION
+        SELECT DISTINCT date_trunc('month', appointment_date)::date FROM appointment_default
+    ) months (month);
+    FOREACH v_month IN ARRAY coalesce(v_months, '{}') LOOP
+        v_name := appointment_create_partition(v_month);
+        IF v_name IS NOT NULL THEN
+            RETURN NEXT v_name;
+        END IF;
+    END LOOP;
+END;
+$$;
+
+CREATE TABLE appointment_default (
+    LIKE appointment INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED
+);
+ALTER TABLE appointment_default ADD CONSTRAINT appointment_default_confirmed_no_overlap
+    EXCLUDE USING gist (caregiver_user_id WITH =, time_range WITH &&) WHERE (status = 'confirmed');
+ALTER TABLE appointment ATTACH PARTITION appointment_default DEFAULT;
+
+SELECT count(*) FROM appointment_ensure_partitions(
+    coalesce((SELECT min(appointment_date) FROM appointment_unpartitioned), current_date),
+    greatest((SELECT max(appointment_date) FROM appointment_unpartitioned),
+             (current_date + interval '12 months')::date)
+);
+
+INSERT INTO appointment (appointment_id, caregiver_user_id, member_user_id, appointment_date,
+                         appointment_time, work_hours, status)
+SELECT appointment_id, caregiver_user_id, member_user_id, appointment_date,
+       appointment_time, work_hours, status
+FROM appointment_unpartitioned;
+
+DROP TABLE appointment_unpartitioned;
+
+-- created on the parent, so every partition (and every future one) gets them
+ALTER TABLE appointment ADD PRIMARY KEY (appointment_id, appointment_date);
+CREATE INDEX appointment_caregiver_date_idx ON appointment (caregiver_user_id, appointment_date);
+CREATE INDEX appointment_member_user_id_idx ON appointment (member_user_id);
+CREATE INDEX appointment_confirmed_caregiver_idx
+    ON appointment (caregiver_user_id) INCLUDE (work_hours)
+    WHERE status = 'confirmed';
+CREATE INDEX appointment_schedule_idx ON appointment (appointment_date, appointment_time, appointment_id);
+
+ALTER TABLE appointment_archive ADD PRIMARY KEY (appointment_id, appointment_date);
+CREATE INDEX appointment_archive_caregiver_date_idx ON appointment_archive (caregiver_user_id, appointment_date);
+
+-- the triggers went with the old table; created after the copy so the
+-- summaries (migration 0003) don't count every row a second time
+CREATE TRIGGER appointment_earnings_insert
+    AFTER INSERT ON appointment
+    FOR EACH ROW WHEN (NEW.status = 'confirmed')
+    EXECUTE FUNCTION appointment_earnings_trigger();
+
+CREATE TRIGGER appointment_earnings_update
+    AFTER UPDATE OF status, work_hours, caregiver_user_id ON appointment
+    FOR EACH ROW WHEN (OLD.status = 'confirmed' OR NEW.status = 'confirmed')
+    EXECUTE FUNCTION appointment_earnings_trigger();
+
+CREATE TRIGGER appointment_earnings_delete
+    AFTER DELETE ON appointment
+    FOR EACH ROW WHEN (OLD.status = 'confirmed')
+    EXECUTE FUNCTION appointment_earnings_trigger();
+
+-- statement triggers on a partitioned table see the rows of every
+-- partition in their transition tables (migration 0006)
+CREATE TRIGGER appointment_notify_insert AFTER INSERT ON appointment REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change('appointment_id');
+CREATE TRIGGER appointment_notify_update AFTER UPDATE ON appointment REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change('appointment_id');
+CREATE TRIGGER appointment_notify_delete AFTER DELETE ON appointment REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change('appointment_id');
+CREATE TRIGGER appointment_notify_truncate AFTER TRUNCATE ON appointment
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change();
+
+-- the overlap check is bounded by date so it only looks at the partitions
+-- the new appointment could overlap with (work_hours < 100, so anything
+-- that overlaps started at most 5 days earlier)
+CREATE OR REPLACE FUNCTION book_appointment(
+    p_caregiver_user_id INTEGER,
+    p_member_user_id INTEGER,
+    p_appointment_date DATE,
+    p_appointment_time TIME,
+    p_work_hours DECIMAL,
+    p_status VARCHAR,
+    p_lock_wait_ms INTEGER DEFAULT 0,
+    OUT outcome TEXT,
+    OUT booked_id INTEGER,
+    OUT conflict_id INTEGER
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_range tsrange := tsrange(p_appointment_date + p_appointment_time,
+                               p_appointment_date + p_appointment_time
+                               + CAST(p_work_hours AS double precision) * interval '1 hour');
+    v_lock_timeout TEXT;
+BEGIN
+    IF p_lock_wait_ms > 0 THEN
+        v_lock_timeout := current_setting('lock_timeout');
+        PERFORM set_config('lock_timeout', p_lock_wait_ms || 'ms', true);
+        BEGIN
+            PERFORM pg_advisory_xact_lock(341002, p_caregiver_user_id);
+        EXCEPTION WHEN lock_not_available THEN
+            PERFORM set_config('lock_timeout', v_lock_timeout, true);
+            outcome := 'busy';
+            RETURN;
+        END;
+        PERFORM set_config('lock_timeout', v_lock_timeout, true);
+    ELSIF NOT pg_try_advisory_xact_lock(341002, p_caregiver_user_id) THEN
+        outcome := 'busy';
+        RETURN;
+    END IF;
+
+    IF p_status IN ('pending', 'confirmed') THEN
+        SELECT a.appointment_id INTO conflict_id
+        FROM appointment a
+        WHERE a.caregiver_user_id = p_caregiver_user_id
+          AND a.status IN ('pending', 'confirmed')
+          AND a.time_range && v_range
+          AND a.appointment_date >= p_appointment_date - 5
+          AND a.appointment_date <= CAST(upper(v_range) AS DATE)
+        LIMIT 1;
+        IF FOUND THEN
+            outcome := 'conflict';
+            RETURN;
+        END IF;
+    END IF;
+
+    INSERT INTO appointment (caregiver_user_id, member_user_id, appointment_date, appointment_time,
+                             work_hours, status)
+    VALUES (p_caregiver_user_id, p_member_user_id, p_appointment_date, p_appointment_time,
+            p_work_hours, p_status)
+    RETURNING appointment_id INTO booked_id;
+    outcome := 'booked';
+END;
+$$;
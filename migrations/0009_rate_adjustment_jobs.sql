@@ -0,0 +1,23 @@
+-- Progress of hourly_rate adjustments run by rate_adjust.py.
+--
+-- A job walks caregiver in caregiver_user_id order, one chunk per
+-- transaction. Each chunk's UPDATE and the job's last_caregiver_user_id
+-- commit together, so a job stopped at any point resumes after the last
+-- committed chunk and no caregiver is adjusted twice.
+--
+-- rule names one of rate_adjust.RULES; amount is its parameter (the
+-- factor for 'multiply', the increment for 'add', unused for 'commission').
+
+CREATE TABLE rate_adjustment_job (
+    job_id SERIAL PRIMARY KEY,
+    rule VARCHAR(20) NOT NULL,
+    amount DECIMAL(10, 4),
+    caregiving_type VARCHAR(50),
+    chunk_size INTEGER NOT NULL CHECK (chunk_size > 0),
+    status VARCHAR(20) NOT NULL DEFAULT 'running' CHECK (status IN ('running', 'finished', 'cancelled')),
+    last_caregiver_user_id INTEGER NOT NULL DEFAULT 0,
+    rows_updated BIGINT NOT NULL DEFAULT 0,
+    started_at TIMESTAMP NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP NOT NULL DEFAULT now(),
+    finished_at TIMESTAMP
+);
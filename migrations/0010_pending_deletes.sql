@@ -0,0 +1,42 @@
+-- Deleting users and members in the background (deletion.py).
+--
+-- Deleting a member or user used to cascade through address, job,
+-- job_application and appointment in the request's transaction. Now the
+-- request only sets deleted_at, which hides the row from every list, and
+-- queues a pending_delete row. deletion.py then removes the dependents a
+-- bounded batch per transaction and deletes the member or user row last.
+--
+-- member.deleted_at marks a member whose member role is going away (the
+-- user stays); "user".deleted_at marks a user who is going away entirely.
+-- Both columns are nullable without a default, so adding them doesn't
+-- rewrite the tables.
+--
+-- pending_delete has no foreign key: it records progress (rows deleted per
+-- step) and outlives the row it deletes.
+
+ALTER TABLE "user" ADD COLUMN deleted_at TIMESTAMP;
+ALTER TABLE member ADD COLUMN deleted_at TIMESTAMP;
+
+CREATE TABLE pending_delete (
+    delete_id SERIAL PRIMARY KEY,
+    kind VARCHAR(10) NOT NULL CHECK (kind IN ('user', 'member')),
+    entity_id INTEGER NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+    step VARCHAR(40),
+    progress JSONB NOT NULL DEFAULT '{}',
+    rows_deleted BIGINT NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    requested_at TIMESTAMP NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP NOT NULL DEFAULT now(),
+    finished_at TIMESTAMP
+);
+
+-- the purgers' queue: oldest unfinished first
+CREATE INDEX pending_delete_queue_idx ON pending_delete (requested_at)
+    WHERE status IN ('pending', 'running');
+
+-- archived appointments are purged by member as well as by caregiver
+-- (appointment_archive_caregiver_date_idx); archived months already carry
+-- appointment's member index, which this one adopts
+CREATE INDEX appointment_archive_member_user_id_idx ON appointment_archive (member_user_id);
@@ -0,0 +1,35 @@
+-- Background tasks (tasks.py).
+--
+-- Web requests queue heavy work here instead of doing it themselves:
+-- exports, rate adjustments, summary rebuilds and deletion purges. Workers
+-- (threads in every web process, or `python tasks.py work`) take tasks with
+-- FOR UPDATE SKIP LOCKED, so any number of them can share the queue.
+--
+-- A failed task goes back to 'queued' with run_after pushed out by the
+-- retry backoff until it has used up max_attempts. A running task whose
+-- heartbeat_at stops moving (its worker died) is taken over by the next
+-- worker once it is TASK_STALE_SECONDS old.
+
+CREATE TABLE task (
+    task_id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(40) NOT NULL,
+    params JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(10) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'done', 'failed', 'cancelled')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5 CHECK (max_attempts > 0),
+    run_after TIMESTAMP NOT NULL DEFAULT now(),
+    worker VARCHAR(100),
+    result JSONB,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- the workers' queue: due tasks first
+CREATE INDEX task_queue_idx ON task (run_after) WHERE status = 'queued';
+
+-- running tasks, for finding the ones whose worker went away
+CREATE INDEX task_running_idx ON task (heartbeat_at) WHERE status = 'running';
@@ -0,0 +1,50 @@
+-- Confirmed appointments can't overlap, across partitions too.
+--
+-- Since migration 0008 each monthly partition has its own
+-- appointment_YYYY_MM_confirmed_no_overlap exclusion constraint (they can't
+-- be declared on a partitioned table). These constraints miss two confirmed
+-- appointments that start in different months and overlap across the
+-- boundary, e.g. 31 Jan 22:00 for 4 hours and 1 Feb 00:30. This constraint
+-- trigger checks every confirmed row written to appointment against all
+-- partitions.
+--
+-- It takes the caregiver's booking lock (class 341002, the one
+-- book_appointment() takes, so a booking that already holds it goes
+-- straight through). Two writes for the same caregiver therefore check one
+-- after the other, and the second sees the first once it has committed.
+-- The date bounds keep the lookup to the partitions the row could overlap
+-- with (work_hours < 100, so an overlapping appointment started at most 5
+-- days earlier). A clash raises exclusion_violation (23P01), the same error
+-- the per-partition constraints raise.
+--
+-- Row triggers on a partitioned table are cloned to every partition,
+-- including ones created later. Rows that are already in the table aren't
+-- re-checked.
+
+CREATE OR REPLACE FUNCTION appointment_check_overlap() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    v_conflict INTEGER;
+BEGIN
+    PERFORM pg_advisory_xact_lock(341002, NEW.caregiver_user_id);
+    SELECT a.appointment_id INTO v_conflict
+    FROM appointment a
+    WHERE a.caregiver_user_id = NEW.caregiver_user_id
+      AND a.status = 'confirmed'
+      AND a.time_range && NEW.time_range
+      AND a.appointment_date >= NEW.appointment_date - 5
+      AND a.appointment_date <= CAST(upper(NEW.time_range) AS DATE)
+      AND a.appointment_id <> NEW.appointment_id
+    LIMIT 1;
+    IF FOUND THEN
+        RAISE EXCEPTION 'appointment % overlaps confirmed appointment % of caregiver %',
+                        NEW.appointment_id, v_conflict, NEW.caregiver_user_id
+            USING ERRCODE = 'exclusion_violation', CONSTRAINT = 'appointment_confirmed_no_overlap';
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE CONSTRAINT TRIGGER appointment_confirmed_no_overlap
+    AFTER INSERT OR UPDATE ON appointment
+    FOR EACH ROW WHEN (NEW.status = 'confirmed')
+    EXECUTE FUNCTION appointment_check_overlap();
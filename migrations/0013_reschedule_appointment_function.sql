@@ -0,0 +1,74 @@
+-- reschedule_appointment(): book_appointment() for edits.
+--
+-- The appointment form used to save edits with a plain UPDATE, with no
+-- booking lock and no pending/confirmed overlap check. Changing an
+-- appointment's status, time or caregiver could therefore double-book. This
+-- function does for an edit what book_appointment() does for a new
+-- appointment. It takes the (new) caregiver's lock, class 341002, waiting at
+-- most p_lock_wait_ms. It checks for an overlapping pending/confirmed
+-- appointment other than the one being edited, then updates the row. The row
+-- is found by its full key, (appointment_id, p_current_date), so only one
+-- partition is touched.
+--
+-- outcome is 'updated', 'conflict' (conflict_id is the appointment in the
+-- way), 'busy' or 'missing' (no such appointment).
+
+CREATE OR REPLACE FUNCTION reschedule_appointment(
+    p_appointment_id INTEGER,
+    p_current_date DATE,
+    p_caregiver_user_id INTEGER,
+    p_member_user_id INTEGER,
+    p_appointment_date DATE,
+    p_appointment_time TIME,
+    p_work_hours DECIMAL,
+    p_status VARCHAR,
+    p_lock_wait_ms INTEGER DEFAULT 0,
+    OUT outcome TEXT,
+    OUT conflict_id INTEGER
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_range tsrange := tsrange(p_appointment_date + p_appointment_time,
+                               p_appointment_date + p_appointment_time
+                               + CAST(p_work_hours AS double precision) * interval '1 hour');
+    v_lock_timeout TEXT;
+BEGIN
+    IF p_lock_wait_ms > 0 THEN
+        v_lock_timeout := current_setting('lock_timeout');
+        PERFORM set_config('lock_timeout', p_lock_wait_ms || 'ms', true);
+        BEGIN
+            PERFORM pg_advisory_xact_lock(341002, p_caregiver_user_id);
+        EXCEPTION WHEN lock_not_available THEN
+            PERFORM set_config('lock_timeout', v_lock_timeout, true);
+            outcome := 'busy';
+            RETURN;
+        END;
+        PERFORM set_config('lock_timeout', v_lock_timeout, true);
+    ELSIF NOT pg_try_advisory_xact_lock(341002, p_caregiver_user_id) THEN
+        outcome := 'busy';
+        RETURN;
+    END IF;
+
+    IF p_status IN ('pending', 'confirmed') THEN
+        SELECT a.appointment_id INTO conflict_id
+        FROM appointment a
+        WHERE a.caregiver_user_id = p_caregiver_user_id
+          AND a.status IN ('pending', 'confirmed')
+          AND a.time_range && v_range
+          AND a.appointment_date >= p_appointment_date - 5
+          AND a.appointment_date <= CAST(upper(v_range) AS DATE)
+          AND a.appointment_id <> p_appointment_id
+        LIMIT 1;
+        IF FOUND THEN
+            outcome := 'conflict';
+            RETURN;
+        END IF;
+    END IF;
+
+    UPDATE appointment
+    SET caregiver_user_id = p_caregiver_user_id, member_user_id = p_member_user_id,
+        appointment_date = p_appointment_date, appointment_time = p_appointment_time,
+        work_hours = p_work_hours, status = p_status
+    WHERE appointment_id = p_appointment_id AND appointment_date = p_current_date;
+    outcome := CASE WHEN FOUND THEN 'updated' ELSE 'missing' END;
+END;
+$$;
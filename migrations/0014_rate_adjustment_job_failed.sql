@@ -0,0 +1,13 @@
+-- Rate adjustment jobs that stop on an error are marked 'failed'.
+--
+-- A chunk that hits anything but a lock timeout (a rate its rule can't
+-- store, a CHECK violation from a caregiver whose rate changed since the
+-- job was checked) would fail the same way on every resume. rate_adjust.py
+-- now ends the job as 'failed' with the error in error, instead of leaving
+-- it 'running' for the next resume or task retry to trip over.
+
+ALTER TABLE rate_adjustment_job
+    DROP CONSTRAINT rate_adjustment_job_status_check,
+    ADD CONSTRAINT rate_adjustment_job_status_check
+        CHECK (status IN ('running', 'finished', 'cancelled', 'failed')),
+    ADD COLUMN error TEXT;
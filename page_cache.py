@@ -0,0 +1,118 @@
+"""
+Rendered-page cache for the read-heavy GET routes.
+
+A cached view declares which tables its page is built from:
+
+    @app.route('/caregivers')
+    @page_cache.cached('caregiver', 'user')
+    def list_caregivers(): ...
+
+Pages are keyed by path and query string and stored with the version of
+each of those tables (see cache.VersionedCache). Write routes call
+page_cache.invalidate('caregiver') after they commit, which makes every page
+built from caregiver stale (/caregivers, /appointments, /job_applications)
+and leaves the rest (/addresses) alone. A hit is served straight from memory
+without touching the database. Every cached page carries an ETag, so
+browsers revalidate with If-None-Match and get a bodyless 304 when nothing
+changed.
+
+Pages that show a flash message are never cached or served from the cache.
+The cache is per process. Writes made by another process arrive through
+change_listener.py; PAGE_CACHE_TTL bounds how long a page can survive one if
+that notification is lost.
+"""
+
+import hashlib
+import os
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, current_app, g, message_flashed, request, session
+
+from cache import VersionedCache
+
+PAGE_CACHE_MAX_BYTES = int(os.getenv('PAGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+PAGE_CACHE_TTL = float(os.getenv('PAGE_CACHE_TTL', '30'))
+
+# ON DELETE CASCADE children of each table (schema.sql)
+CASCADES = {
+    'user': ('caregiver', 'member'),
+    'caregiver': ('job_application', 'appointment'),
+    'member': ('address', 'job', 'appointment'),
+    'job': ('job_application',),
+}
+
+
+class CachedPage:
+    __slots__ = ('body', 'mimetype', 'etag')
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _flashed(sender, message, category, **extra):
+    g.page_flashed = True
+
+
+def cascade(tables):
+    """tables plus everything a DELETE on them cascades to"""
+    seen = []
+    pending = list(tables)
+    while pending:
+        table = pending.pop()
+        if table not in seen:
+            seen.append(table)
+            pending.extend(CASCADES.get(table, ()))
+    return seen
+
+
+class PageCache:
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_BYTES, ttl=PAGE_CACHE_TTL):
+        self.enabled = max_bytes > 0
+        self.store = VersionedCache(max_weight=max_bytes, ttl=ttl, weigh=lambda page: len(page.body))
+        message_flashed.connect(_flashed)
+
+    def invalidate(self, *tables, cascade_delete=False):
+        """Mark every page built from these tables stale; call after commit"""
+        self.store.invalidate(*(cascade(tables) if cascade_delete else tables))
+
+    def clear(self):
+        self.store.clear()
+
+    def cached(self, *tables):
+        """Cache a view's GET responses; tables are the ones its page reads"""
+        tables = tuple(tables)
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or request.method != 'GET' or session.get('_flashes'):
+                    return view(*args, **kwargs)
+                key = request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+                page = self.store.get(tables, key)
+                if page is not None:
+                    response = Response(page.body, mimetype=page.mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return _conditional(response, page.etag)
+
+                # versions from before the view ran, so a write that commits
+                # while it renders leaves this entry stale instead of fresh
+                version = self.store.version(tables)
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough or g.get('page_flashed'):
+                    return response
+                page = CachedPage(response.get_data(), response.mimetype)
+                self.store.set(tables, key, page, version)
+                response.headers['X-Cache'] = 'MISS'
+                return _conditional(response, page.etag)
+            return wrapper
+        return decorator
+
+
+def _conditional(response, etag):
+    response.set_etag(etag)
+    # let browsers keep the page but check back with If-None-Match every time
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
@@ -0,0 +1,138 @@
+"""
+Keyset (cursor) pagination helpers for the list pages in app.py.
+
+Instead of OFFSET, each page remembers the sort key of its first and last row
+and the next query starts right after (or right before) that key, so the
+database only ever reads one page worth of index entries no matter how deep
+you are in the table.
+"""
+
+import base64
+import json
+import os
+
+from flask import request, url_for
+from sqlalchemy import text
+
+from rows import compact
+from statements import Statement
+
+# default rows per page, can be overridden per request with ?per_page=
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '500'))
+
+
+class Page:
+    """One page of rows (compact rows, see rows.py) plus the cursors needed to move around"""
+
+    def __init__(self, items, next_cursor, prev_cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+
+def encode_cursor(values):
+    """Turn a tuple of key values into a url-safe token"""
+    raw = json.dumps([v if isinstance(v, (int, float)) else str(v) for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Reverse of encode_cursor, returns None for anything malformed"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def get_page_size(args):
+    """Read ?per_page= from the request, clamped to MAX_PAGE_SIZE"""
+    try:
+        per_page = int(args.get('per_page', PAGE_SIZE))
+    except (TypeError, ValueError):
+        per_page = PAGE_SIZE
+    return max(1, min(per_page, MAX_PAGE_SIZE))
+
+
+def page_url(**cursor):
+    """URL of the current page with a different cursor, other args kept"""
+    args = {k: v for k, v in request.args.items() if k not in ('after', 'before')}
+    args.update(cursor)
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def fetch_page(session, base_query, keys, args, params=None, where=None, descending=False):
+    """
+    Run base_query (a SELECT ... FROM ... JOIN ... without WHERE/ORDER BY) one
+    page at a time.
+
+    keys is a list of (column expression, row field) pairs that together form a
+    unique sort key, e.g. [('ja.caregiver_user_id', 'caregiver_user_id'),
+    ('ja.job_id', 'job_id')]. They should match an index so the row comparison
+    below turns into an index range scan. descending=True sorts the whole key
+    high to low (e.g. search results by rank). base_query may be a registered
+    statement (statements.py), in which case the page query is prepared too
+    and the statement's own where= condition is always added.
+    """
+    per_page = get_page_size(args)
+    params = dict(params or {})
+    columns = [column for column, _ in keys]
+    fields = [field for _, field in keys]
+    key_params = [f'_k{i}' for i in range(len(keys))]
+
+    after = decode_cursor(args.get('after'), len(keys))
+    before = None if after else decode_cursor(args.get('before'), len(keys))
+
+    conditions = [c for c in (getattr(base_query, 'where', None), where) if c]
+    backwards = before is not None
+    # walking backwards through an ascending list is a descending scan and
+    # the other way round
+    flip = backwards != descending
+    if after or before:
+        op = '<' if flip else '>'
+        conditions.append(
+            f"({', '.join(columns)}) {op} ({', '.join(':' + p for p in key_params)})"
+        )
+        if len(keys) > 1:
+            # implied by the row comparison, but only a plain bound on the
+            # first column lets Postgres skip partitions (appointment by date)
+            conditions.append(f"{columns[0]} {op}= :{key_params[0]}")
+        params.update(zip(key_params, before if backwards else after))
+
+    direction = 'DESC' if flip else 'ASC'
+    sql = base_query.sql if isinstance(base_query, Statement) else base_query
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(f'({c})' for c in conditions)
+    sql += ' ORDER BY ' + ', '.join(f'{c} {direction}' for c in columns)
+    sql += ' LIMIT :_limit'
+    params['_limit'] = per_page + 1
+
+    if isinstance(base_query, Statement):
+        result = base_query.variant(sql).execute(session, params)
+    else:
+        result = session.execute(text(sql), params)
+    rows = compact(result)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def cursor_for(row):
+        return encode_cursor([row[f] for f in fields])
+
+    next_cursor = prev_cursor = None
+    if rows:
+        # going forward we know there's something behind us if we came from
+        # a cursor, and vice versa when paging backwards
+        if has_more or backwards:
+            next_cursor = cursor_for(rows[-1])
+        if (has_more and backwards) or after:
+            prev_cursor = cursor_for(rows[0])
+    return Page(rows, next_cursor, prev_cursor, per_page)
@@ -0,0 +1,43 @@
+"""
+Compact rows for pages of query results.
+
+A page of 500 rows as dicts costs a hash table per row on top of the values.
+fetch_page() instead returns rows as instances of a small tuple subclass,
+one class per column list, so a row is a single tuple of its values. Templates
+read them exactly like dicts (row.given_name), code can use row['given_name']
+or row[0], and row._asdict() gives a dict back for jsonify().
+"""
+
+import threading
+from collections import namedtuple
+
+_types = {}
+_lock = threading.Lock()
+
+
+def row_type(fields):
+    """The compact row class for this column list, created once and reused"""
+    fields = tuple(fields)
+    cls = _types.get(fields)
+    if cls is None:
+        with _lock:
+            cls = _types.get(fields)
+            if cls is None:
+                base = namedtuple('Row', fields, rename=True)
+                cls = _types[fields] = type('Row', (base,), {
+                    '__slots__': (),
+                    '__getitem__': _getitem,
+                })
+    return cls
+
+
+def _getitem(self, key):
+    if isinstance(key, str):
+        return getattr(self, key)
+    return tuple.__getitem__(self, key)
+
+
+def compact(result):
+    """All rows of a SQLAlchemy result as compact rows"""
+    make = row_type(result.keys())._make
+    return [make(row) for row in result]
@@ -2,6 +2,14 @@
 -- Online Caregivers Platform
 
 -- Drop tables if they exist (for clean setup)
+-- schema_migrations goes too so `python migrate.py` re-applies everything
+DROP TABLE IF EXISTS schema_migrations;
+DROP TABLE IF EXISTS task;
+DROP TABLE IF EXISTS pending_delete;
+DROP TABLE IF EXISTS rate_adjustment_job;
+DROP TABLE IF EXISTS caregiver_earnings_summary;
+DROP TABLE IF EXISTS platform_earnings_summary;
+DROP TABLE IF EXISTS appointment_archive CASCADE;
 DROP TABLE IF EXISTS appointment CASCADE;
 DROP TABLE IF EXISTS job_application CASCADE;
 DROP TABLE IF EXISTS job CASCADE;
@@ -82,6 +90,22 @@ CREATE TABLE appointment (
     FOREIGN KEY (member_user_id) REFERENCES member(member_user_id) ON DELETE CASCADE
 );
 
+-- Indexes on foreign keys and common filters
+-- (same set as migrations/0001_foreign_key_and_filter_indexes.sql, which
+-- adds them to an existing database without downtime)
+CREATE INDEX job_member_user_id_idx ON job (member_user_id);
+CREATE INDEX job_application_job_id_idx ON job_application (job_id);
+CREATE INDEX appointment_caregiver_date_idx ON appointment (caregiver_user_id, appointment_date);
+CREATE INDEX appointment_member_user_id_idx ON appointment (member_user_id);
+CREATE INDEX appointment_confirmed_caregiver_idx ON appointment (caregiver_user_id) INCLUDE (work_hours)
+    WHERE status = 'confirmed';
+CREATE INDEX appointment_schedule_idx ON appointment (appointment_date, appointment_time, appointment_id);
+CREATE INDEX caregiver_caregiving_type_idx ON caregiver (caregiving_type, hourly_rate);
+CREATE INDEX job_required_type_member_idx ON job (required_caregiving_type, member_user_id);
+CREATE INDEX address_street_idx ON address (street);
+CREATE INDEX user_city_idx ON "user" (city);
+CREATE INDEX user_name_idx ON "user" (given_name, surname);
+
 -- Insert data into USER table (at least 10 instances)
 INSERT INTO "user" (email, given_name, surname, city, phone_number, profile_description, password) VALUES
 ('sarah.johnson@email.com', 'Sarah', 'Johnson', 'Astana', '+77012345678', 'Experienced caregiver with 5 years of experience', 'pass123'),
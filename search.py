@@ -0,0 +1,96 @@
+"""
+Ranked keyword search over job postings and member/user profiles.
+
+Each scope matches a to_tsvector() expression that has a GIN index on it
+(migrations/0002_search_indexes.sql). The expressions here have to stay
+character-for-character identical to the indexed ones or Postgres won't use
+the index. Users and members pending deletion (deletion.py) don't match.
+
+ts_rank() has to rebuild the document of every row it scores, so a common
+word would rank tens of thousands of matches just to show the first page.
+Only the newest SEARCH_CANDIDATES matches (by id, default 1000) are ranked
+and paged through; a query matching more than that should be narrowed.
+
+ts_rank() returns real; rank is selected as float8 so the value that goes
+into the page cursor compares equal to the row it came from.
+"""
+
+import os
+
+from pagination import fetch_page
+
+SEARCH_CANDIDATES = int(os.getenv('SEARCH_CANDIDATES', '1000'))
+
+JOB_DOCUMENT = "to_tsvector('english', coalesce(j.other_requirements, ''))"
+MEMBER_DOCUMENT = ("to_tsvector('english', coalesce(m.house_rules, '') || ' ' || "
+                   "coalesce(m.dependent_description, ''))")
+USER_DOCUMENT = "to_tsvector('english', coalesce(u.profile_description, ''))"
+
+SCOPES = {
+    'jobs': {
+        'label': 'Jobs',
+        'query': f"""
+            SELECT * FROM (
+                SELECT j.*, ts_rank({JOB_DOCUMENT}, q)::float8 AS rank
+                FROM (
+                    SELECT j.job_id, j.required_caregiving_type, j.other_requirements, j.date_posted,
+                           u.given_name, u.surname
+                    FROM job j
+                    JOIN member m ON j.member_user_id = m.member_user_id
+                    JOIN "user" u ON j.member_user_id = u.user_id,
+                         websearch_to_tsquery('english', :q) q
+                    WHERE {JOB_DOCUMENT} @@ q
+                      AND m.deleted_at IS NULL AND u.deleted_at IS NULL
+                    ORDER BY j.job_id DESC
+                    LIMIT :candidates
+                ) j, websearch_to_tsquery('english', :q) q
+            ) s
+        """,
+        'keys': [('s.rank', 'rank'), ('s.job_id', 'job_id')],
+    },
+    'members': {
+        'label': 'Members',
+        'query': f"""
+            SELECT * FROM (
+                SELECT m.*, ts_rank({MEMBER_DOCUMENT}, q)::float8 AS rank
+                FROM (
+                    SELECT m.member_user_id, m.house_rules, m.dependent_description,
+                           u.given_name, u.surname, u.city
+                    FROM member m
+                    JOIN "user" u ON m.member_user_id = u.user_id,
+                         websearch_to_tsquery('english', :q) q
+                    WHERE {MEMBER_DOCUMENT} @@ q
+                      AND m.deleted_at IS NULL AND u.deleted_at IS NULL
+                    ORDER BY m.member_user_id DESC
+                    LIMIT :candidates
+                ) m, websearch_to_tsquery('english', :q) q
+            ) s
+        """,
+        'keys': [('s.rank', 'rank'), ('s.member_user_id', 'member_user_id')],
+    },
+    'users': {
+        'label': 'User Profiles',
+        'query': f"""
+            SELECT * FROM (
+                SELECT u.*, ts_rank({USER_DOCUMENT}, q)::float8 AS rank
+                FROM (
+                    SELECT u.user_id, u.given_name, u.surname, u.city, u.profile_description
+                    FROM "user" u,
+                         websearch_to_tsquery('english', :q) q
+                    WHERE {USER_DOCUMENT} @@ q
+                      AND u.deleted_at IS NULL
+                    ORDER BY u.user_id DESC
+                    LIMIT :candidates
+                ) u, websearch_to_tsquery('english', :q) q
+            ) s
+        """,
+        'keys': [('s.rank', 'rank'), ('s.user_id', 'user_id')],
+    },
+}
+
+
+def search(session, scope, q, args):
+    """One page of matches for q in the given scope, best match first (among the newest SEARCH_CANDIDATES)"""
+    spec = SCOPES[scope]
+    return fetch_page(session, spec['query'], spec['keys'], args,
+                      params={'q': q, 'candidates': SEARCH_CANDIDATES}, descending=True)
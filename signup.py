@@ -0,0 +1,62 @@
+"""
+Caregiver and member sign-up in one round trip.
+
+A new caregiver is a "user" row plus a caregiver row; a new member is a
+"user" row, a member row and optionally their address. Each is written by a
+single INSERT with data-modifying CTEs (create_caregiver, create_member and
+create_member_with_address in statements.py), so signing up costs one
+statement instead of an INSERT ... RETURNING, a fetch and one more INSERT per
+table, and either every row is written or none is.
+
+The same functions back the HTML forms and the JSON API in app.py; data is
+request.form or the parsed JSON body.
+"""
+
+import statements
+
+USER_FIELDS = ('email', 'given_name', 'surname', 'city', 'phone_number', 'password')
+CAREGIVER_FIELDS = ('gender', 'caregiving_type', 'hourly_rate')
+ADDRESS_FIELDS = ('house_number', 'street', 'town')
+# what a field may hold; None is an absent optional field
+SCALARS = (str, int, float, type(None))
+
+
+def _params(data, required, optional=()):
+    """Statement parameters from data; ValueError naming any missing or non-scalar field"""
+    missing = [field for field in required if data.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f"missing required field(s): {', '.join(missing)}")
+    # a JSON object or array can't be bound as a column value; true/false pass
+    # isinstance(..., int), so booleans are turned away by name
+    nested = [field for field in (*required, *optional)
+              if isinstance(data.get(field), bool) or not isinstance(data.get(field), SCALARS)]
+    if nested:
+        raise ValueError(f"field(s) must be a string or number: {', '.join(nested)}")
+    params = {field: data[field] for field in required}
+    params.update({field: data.get(field) or '' for field in optional})
+    return params
+
+
+def caregiver_params(data):
+    return _params(data, USER_FIELDS + CAREGIVER_FIELDS, ('profile_description', 'photo'))
+
+
+def member_params(data):
+    """Parameters for the member statements; the address is all three of its fields or none"""
+    params = _params(data, USER_FIELDS, ('profile_description', 'house_rules', 'dependent_description'))
+    if any(data.get(field) for field in ADDRESS_FIELDS):
+        params.update(_params(data, ADDRESS_FIELDS))
+    return params
+
+
+def create_caregiver(session, data):
+    """Insert user + caregiver, returns the new user_id; the caller commits"""
+    return statements.execute(session, 'create_caregiver', caregiver_params(data)).scalar_one()
+
+
+def create_member(session, data):
+    """Insert user + member (+ address), returns (user_id, address written); the caller commits"""
+    params = member_params(data)
+    with_address = 'house_number' in params
+    name = 'create_member_with_address' if with_address else 'create_member'
+    return statements.execute(session, name, params).scalar_one(), with_address
@@ -0,0 +1,401 @@
+"""
+Named SQL statements for the web application, prepared once per connection.
+
+Every statement app.py runs is registered here under a name and handlers run
+it with
+
+    statements.execute(session, 'get_user', {'user_id': user_id})
+
+The first time a pooled connection runs a statement it is sent to Postgres
+with PREPARE; after that only EXECUTE get_user(...) and the parameter values
+go over the wire, so the server skips parsing and, once it settles on a
+generic plan (after five executions), planning too. That matters most for
+the five-way join behind /job_applications and the four-way join behind
+/appointments. The list pages pass a registered statement to fetch_page(),
+which prepares each WHERE/ORDER BY variant it builds the same way.
+
+Prepared statements live in the Postgres session, so they are switched off
+when DB_POOL_MODE=transaction (a pooler may hand each transaction a different
+server connection) and can be switched off with DB_PREPARED_STATEMENTS=0.
+They also pin the result columns of SELECT *: after a migration that changes
+a table's columns, restart the workers (or let DB_POOL_RECYCLE replace the
+connections).
+
+The PREPARE goes through SQLAlchemy like any other statement, so
+instrumentation.py counts and times it, and describe() maps an
+EXECUTE name(...) back to its SQL for the slow-query log.
+"""
+
+import os
+import re
+import threading
+
+from sqlalchemy import text
+
+import connection_pool
+
+PREPARED_STATEMENTS = (os.getenv('DB_PREPARED_STATEMENTS', '1').lower() not in ('0', 'false', 'no', 'off')
+                       and connection_pool.POOL_MODE != 'transaction')
+
+# same rule as sqlalchemy's text(): :name, but not ::type casts
+_BIND_PARAM = re.compile(r'(?<![:\w\\]):(\w+)(?!:)')
+
+_EXECUTE = re.compile(r'EXECUTE (\w+)')
+
+# names already prepared on a connection, kept in its pool record's info dict
+# so they go away together with the server session
+_PREPARED_KEY = 'prepared_statements'
+
+# every Statement by name, variants included, for describe()
+_by_name = {}
+
+
+class Statement:
+    def __init__(self, name, sql, where=None):
+        self.name = name
+        self.sql = sql
+        # condition fetch_page() always adds to a list statement
+        self.where = where
+        self.clause = text(sql)
+        # positional $n in order of first appearance, for PREPARE
+        self.params = []
+        for param in _BIND_PARAM.findall(sql):
+            if param not in self.params:
+                self.params.append(param)
+        body = _BIND_PARAM.sub(lambda m: f'${self.params.index(m.group(1)) + 1}', sql)
+        self.prepare_sql = f'PREPARE {name} AS {body}'
+        args = ', '.join(':' + param for param in self.params)
+        self.execute_clause = text(f'EXECUTE {name}({args})' if args else f'EXECUTE {name}')
+        self._variants = {}
+        self._lock = threading.Lock()
+        _by_name[name] = self
+
+    def variant(self, sql):
+        """A statement derived from this one (e.g. a page query), registered under name_<n>"""
+        with self._lock:
+            statement = self._variants.get(sql)
+            if statement is None:
+                statement = Statement(f'{self.name}_{len(self._variants) + 1}', sql)
+                self._variants[sql] = statement
+            return statement
+
+    def execute(self, session, params=None):
+        if not PREPARED_STATEMENTS:
+            return session.execute(self.clause, params)
+        conn = session.connection()
+        prepared = conn.info.setdefault(_PREPARED_KEY, set())
+        if self.name not in prepared:
+            # no_parameters: sent as is, so no % escaping
+            conn.exec_driver_sql(self.prepare_sql, execution_options={'no_parameters': True})
+            prepared.add(self.name)
+        return session.execute(self.execute_clause, params)
+
+
+class Registry:
+    def __init__(self):
+        self._statements = {}
+
+    def register(self, name, sql, where=None):
+        if name in self._statements:
+            raise ValueError(f'statement {name!r} is already registered')
+        statement = self._statements[name] = Statement(name, sql, where)
+        return statement
+
+    def __getitem__(self, name):
+        return self._statements[name]
+
+    def __iter__(self):
+        return iter(self._statements.values())
+
+
+registry = Registry()
+register = registry.register
+
+
+def get(name):
+    return registry[name]
+
+
+def execute(session, name, params=None):
+    """Run a registered statement by name in the session's transaction"""
+    return registry[name].execute(session, params)
+
+
+def describe(sql):
+    """(statement name, its SQL) for an EXECUTE name(...) sent by this module, else (None, sql)"""
+    match = _EXECUTE.match(sql)
+    statement = _by_name.get(match.group(1)) if match else None
+    if statement is None:
+        return None, sql
+    return statement.name, statement.sql
+
+
+# The list_* statements select only the columns their list.html shows; long
+# free-text columns are cut to one character more than the template displays
+# so it can still tell whether to add "...". Their where= leaves out users and
+# members that are pending deletion (deletion.py).
+
+# ============================================================================
+# USER
+# ============================================================================
+
+register('list_users', 'SELECT user_id, email, given_name, surname, city, phone_number FROM "user"',
+         where='deleted_at IS NULL')
+register('get_user', 'SELECT * FROM "user" WHERE user_id = :user_id')
+register('insert_user', """
+    INSERT INTO "user" (email, given_name, surname, city, phone_number, profile_description, password)
+    VALUES (:email, :given_name, :surname, :city, :phone_number, :profile_description, :password)
+    RETURNING user_id
+""")
+register('update_user', """
+    UPDATE "user"
+    SET email = :email, given_name = :given_name, surname = :surname,
+        city = :city, phone_number = :phone_number,
+        profile_description = :profile_description, password = :password
+    WHERE user_id = :user_id
+""")
+# hidden at once, removed by deletion.py in the background
+register('mark_users_deleted', """
+    WITH marked AS (
+        UPDATE "user" SET deleted_at = now()
+        WHERE user_id = ANY(:ids) AND deleted_at IS NULL
+        RETURNING user_id
+    )
+    INSERT INTO pending_delete (kind, entity_id)
+    SELECT 'user', user_id FROM marked
+    RETURNING delete_id
+""")
+
+# ============================================================================
+# CAREGIVER
+# ============================================================================
+
+register('list_caregivers', """
+    SELECT c.caregiver_user_id, u.given_name, u.surname, u.email, u.city,
+           c.gender, c.caregiving_type, c.hourly_rate
+    FROM caregiver c
+    JOIN "user" u ON c.caregiver_user_id = u.user_id
+""", where='u.deleted_at IS NULL')
+register('get_caregiver', """
+    SELECT c.*, u.given_name, u.surname, u.email, u.city, u.phone_number, u.profile_description
+    FROM caregiver c
+    JOIN "user" u ON c.caregiver_user_id = u.user_id
+    WHERE c.caregiver_user_id = :caregiver_id
+""")
+# user + caregiver in one statement (see signup.py)
+register('create_caregiver', """
+    WITH new_user AS (
+        INSERT INTO "user" (email, given_name, surname, city, phone_number, profile_description, password)
+        VALUES (:email, :given_name, :surname, :city, :phone_number, :profile_description, :password)
+        RETURNING user_id
+    )
+    INSERT INTO caregiver (caregiver_user_id, photo, gender, caregiving_type, hourly_rate)
+    VALUES ((SELECT user_id FROM new_user), :photo, :gender, :caregiving_type, :hourly_rate)
+    RETURNING caregiver_user_id
+""")
+register('update_caregiver', """
+    UPDATE caregiver
+    SET photo = :photo, gender = :gender, caregiving_type = :caregiving_type, hourly_rate = :hourly_rate
+    WHERE caregiver_user_id = :caregiver_user_id
+""")
+register('delete_caregiver', 'DELETE FROM caregiver WHERE caregiver_user_id = :caregiver_id')
+
+# ============================================================================
+# MEMBER
+# ============================================================================
+
+register('list_members', """
+    SELECT m.member_user_id, u.given_name, u.surname, u.email, u.city, u.phone_number,
+           left(m.house_rules, 51) AS house_rules
+    FROM member m
+    JOIN "user" u ON m.member_user_id = u.user_id
+""", where='m.deleted_at IS NULL AND u.deleted_at IS NULL')
+register('get_member', """
+    SELECT m.*, u.given_name, u.surname, u.email, u.city, u.phone_number, u.profile_description
+    FROM member m
+    JOIN "user" u ON m.member_user_id = u.user_id
+    WHERE m.member_user_id = :member_id
+""")
+# user + member, and user + member + address, in one statement (see signup.py)
+register('create_member', """
+    WITH new_user AS (
+        INSERT INTO "user" (email, given_name, surname, city, phone_number, profile_description, password)
+        VALUES (:email, :given_name, :surname, :city, :phone_number, :profile_description, :password)
+        RETURNING user_id
+    )
+    INSERT INTO member (member_user_id, house_rules, dependent_description)
+    VALUES ((SELECT user_id FROM new_user), :house_rules, :dependent_description)
+    RETURNING member_user_id
+""")
+register('create_member_with_address', """
+    WITH new_user AS (
+        INSERT INTO "user" (email, given_name, surname, city, phone_number, profile_description, password)
+        VALUES (:email, :given_name, :surname, :city, :phone_number, :profile_description, :password)
+        RETURNING user_id
+    ), new_member AS (
+        INSERT INTO member (member_user_id, house_rules, dependent_description)
+        VALUES ((SELECT user_id FROM new_user), :house_rules, :dependent_description)
+        RETURNING member_user_id
+    )
+    INSERT INTO address (member_user_id, house_number, street, town)
+    VALUES ((SELECT member_user_id FROM new_member), :house_number, :street, :town)
+    RETURNING member_user_id
+""")
+register('update_member', """
+    UPDATE member
+    SET house_rules = :house_rules, dependent_description = :dependent_description
+    WHERE member_user_id = :member_user_id
+""")
+register('mark_members_deleted', """
+    WITH marked AS (
+        UPDATE member SET deleted_at = now()
+        WHERE member_user_id = ANY(:ids) AND deleted_at IS NULL
+        RETURNING member_user_id
+    )
+    INSERT INTO pending_delete (kind, entity_id)
+    SELECT 'member', member_user_id FROM marked
+    RETURNING delete_id
+""")
+
+# ============================================================================
+# ADDRESS
+# ============================================================================
+
+register('list_addresses', """
+    SELECT a.member_user_id, u.given_name, u.surname, a.house_number, a.street, a.town
+    FROM address a
+    JOIN member m ON a.member_user_id = m.member_user_id
+    JOIN "user" u ON m.member_user_id = u.user_id
+""", where='m.deleted_at IS NULL AND u.deleted_at IS NULL')
+register('get_address', 'SELECT * FROM address WHERE member_user_id = :member_id')
+register('insert_address', """
+    INSERT INTO address (member_user_id, house_number, street, town)
+    VALUES (:member_user_id, :house_number, :street, :town)
+""")
+register('update_address', """
+    UPDATE address
+    SET house_number = :house_number, street = :street, town = :town
+    WHERE member_user_id = :member_user_id
+""")
+register('delete_address', 'DELETE FROM address WHERE member_user_id = :member_id')
+
+# ============================================================================
+# JOB
+# ============================================================================
+
+register('list_jobs', """
+    SELECT j.job_id, u.given_name, u.surname, j.required_caregiving_type,
+           left(j.other_requirements, 51) AS other_requirements, j.date_posted
+    FROM job j
+    JOIN member m ON j.member_user_id = m.member_user_id
+    JOIN "user" u ON m.member_user_id = u.user_id
+""", where='m.deleted_at IS NULL AND u.deleted_at IS NULL')
+register('get_job', 'SELECT * FROM job WHERE job_id = :job_id')
+register('insert_job', """
+    INSERT INTO job (member_user_id, required_caregiving_type, other_requirements, date_posted)
+    VALUES (:member_user_id, :required_caregiving_type, :other_requirements, :date_posted)
+""")
+register('update_job', """
+    UPDATE job
+    SET member_user_id = :member_user_id, required_caregiving_type = :required_caregiving_type,
+        other_requirements = :other_requirements, date_posted = :date_posted
+    WHERE job_id = :job_id
+""")
+register('delete_job', 'DELETE FROM job WHERE job_id = :job_id')
+
+# ============================================================================
+# JOB_APPLICATION
+# ============================================================================
+
+register('list_job_applications', """
+    SELECT ja.caregiver_user_id, ja.job_id, ja.date_applied,
+           u1.given_name AS caregiver_name, u1.surname AS caregiver_surname,
+           u2.given_name AS member_name, u2.surname AS member_surname, j.required_caregiving_type
+    FROM job_application ja
+    JOIN caregiver c ON ja.caregiver_user_id = c.caregiver_user_id
+    JOIN "user" u1 ON c.caregiver_user_id = u1.user_id
+    JOIN job j ON ja.job_id = j.job_id
+    JOIN member m ON j.member_user_id = m.member_user_id
+    JOIN "user" u2 ON m.member_user_id = u2.user_id
+""", where='u1.deleted_at IS NULL AND m.deleted_at IS NULL AND u2.deleted_at IS NULL')
+register('get_job_application', """
+    SELECT * FROM job_application
+    WHERE caregiver_user_id = :caregiver_id AND job_id = :job_id
+""")
+register('insert_job_application', """
+    INSERT INTO job_application (caregiver_user_id, job_id, date_applied)
+    VALUES (:caregiver_user_id, :job_id, :date_applied)
+""")
+register('update_job_application', """
+    UPDATE job_application
+    SET date_applied = :date_applied
+    WHERE caregiver_user_id = :caregiver_id AND job_id = :job_id
+""")
+register('delete_job_application', """
+    DELETE FROM job_application
+    WHERE caregiver_user_id = :caregiver_id AND job_id = :job_id
+""")
+
+# ============================================================================
+# APPOINTMENT
+# ============================================================================
+
+register('list_appointments', """
+    SELECT a.appointment_id, a.appointment_date, a.appointment_time, a.work_hours, a.status,
+           u1.given_name AS caregiver_name, u1.surname AS caregiver_surname,
+           u2.given_name AS member_name, u2.surname AS member_surname
+    FROM appointment a
+    JOIN caregiver c ON a.caregiver_user_id = c.caregiver_user_id
+    JOIN "user" u1 ON c.caregiver_user_id = u1.user_id
+    JOIN member m ON a.member_user_id = m.member_user_id
+    JOIN "user" u2 ON m.member_user_id = u2.user_id
+""", where='u1.deleted_at IS NULL AND m.deleted_at IS NULL AND u2.deleted_at IS NULL')
+# appointment is partitioned by appointment_date (migrations/0008), so
+# single-row statements take the date too and touch one partition only
+register('get_appointment', """
+    SELECT * FROM appointment WHERE appointment_id = :appointment_id AND appointment_date = :appointment_date
+""")
+# edits go through booking.reschedule()
+register('delete_appointment', """
+    DELETE FROM appointment WHERE appointment_id = :appointment_id AND appointment_date = :appointment_date
+""")
+
+# ============================================================================
+# TASK (tasks.py)
+# ============================================================================
+
+# with :unique, an identical task still waiting in the queue is reused
+register('enqueue_task', """
+    WITH existing AS (
+        SELECT task_id FROM task
+        WHERE CAST(:unique AS BOOLEAN) AND kind = :kind AND status = 'queued'
+          AND params = CAST(:params AS JSONB)
+        LIMIT 1
+    ), inserted AS (
+        INSERT INTO task (kind, params, max_attempts)
+        SELECT :kind, CAST(:params AS JSONB), CAST(:max_attempts AS INTEGER)
+        WHERE NOT EXISTS (SELECT 1 FROM existing)
+        RETURNING task_id
+    )
+    SELECT task_id FROM inserted
+    UNION ALL
+    SELECT task_id FROM existing
+""")
+register('get_task', """
+    SELECT task_id, kind, params, status, attempts, max_attempts, run_after, worker, result, last_error,
+           created_at, started_at, heartbeat_at, finished_at
+    FROM task
+    WHERE task_id = :task_id
+""")
+register('recent_tasks', """
+    SELECT task_id, kind, status, attempts, max_attempts, run_after, last_error, created_at, finished_at
+    FROM task
+    WHERE (CAST(:status AS VARCHAR) IS NULL OR status = :status)
+      AND (CAST(:kind AS VARCHAR) IS NULL OR kind = :kind)
+    ORDER BY task_id DESC
+    LIMIT :limit
+""")
+register('cancel_task', """
+    UPDATE task SET status = 'cancelled', finished_at = now()
+    WHERE task_id = :task_id AND status = 'queued'
+""")